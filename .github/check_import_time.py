@@ -0,0 +1,52 @@
+"""Check import time of the plugin modules.
+Import each module loaded through an entry point in a fresh interpreter, after aiida-core has
+already been imported, and make sure the time spent in the plugin stays within the budget and
+that pymatgen is not imported on the way.
+"""
+import os
+import subprocess
+import sys
+
+THIS_PATH = os.path.split(os.path.realpath(__file__))[0]
+
+# Budget in seconds for importing a plugin module on top of aiida-core
+BUDGET = float(sys.argv[1]) if len(sys.argv) > 1 else 0.25
+MODULES = [
+    'aiida_supercell.calculations',
+    'aiida_supercell.calculations.resample',
+    'aiida_supercell.parsers',
+    'aiida_supercell.workflows',
+]
+REPEATS = 5
+
+SCRIPT = """
+import sys
+import time
+import aiida.engine, aiida.orm, aiida.parsers
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(any(name.split('.')[0] == 'pymatgen' for name in sys.modules))
+"""
+
+FAILED = False
+for module in MODULES:
+    timings = []
+    for _ in range(REPEATS):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT.format(module=module)],
+                                         cwd=os.path.join(THIS_PATH, os.pardir),
+                                         universal_newlines=True)
+        timing, pymatgen_imported = output.split()
+        timings.append(float(timing))
+    print(f"'{module}': {min(timings):.3f} s (budget {BUDGET:.3f} s)")
+    if pymatgen_imported == 'True':
+        print(f"'{module}' imports pymatgen at module level")
+        FAILED = True
+    if min(timings) > BUDGET:
+        print(f"'{module}' takes longer than the budget to import")
+        FAILED = True
+
+if FAILED:
+    sys.exit(1)
+
+#EOF
@@ -0,0 +1,252 @@
+"""AiiDA-Supercell plugin -- High-throughput submission of many disordered structures"""
+
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+from aiida import orm
+
+STATUS_SUBMITTED = 'submitted'
+STATUS_SKIPPED = 'skipped'
+CHARGE_TOLERANCE = 1e-3
+CHECKSUM_EXTRA = 'cif_checksum'
+
+
+def collect_cifs(cifs) -> list:
+    """Returns the sorted absolute paths of the CIF files of a directory, or of a list of paths."""
+    if isinstance(cifs, (str, os.PathLike)) and os.path.isdir(cifs):
+        cifs = [os.path.join(cifs, name) for name in os.listdir(cifs) if name.lower().endswith('.cif')]
+    elif isinstance(cifs, (str, os.PathLike)):
+        cifs = [cifs]
+    return sorted(os.path.abspath(path) for path in cifs)
+
+
+def _get_checksum(path: str) -> str:
+    """Returns the SHA-256 digest of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def screen_cif(path: str, supercell_size: list, tolerance: float = 0.75, charges: dict = None) -> dict:
+    """Estimates the configuration space and the total charge of a CIF file
+
+    Args:
+        path (str): Path of the CIF file.
+        supercell_size (list): Supercell size along the three lattice vectors.
+        tolerance (float): The maximum distance (in Angstroms) between sites of the same group.
+        charges (dict): Formal charges as given to `SupercellCalculation`. Defaults to oxidation states of the CIF.
+    Returns:
+        dict: The decimal logarithm of the number of combinations and the total charge of the unit cell,
+        None if the file does not give all oxidation numbers, or the error met while reading the file.
+    """
+    # pylint: disable=import-outside-toplevel
+    from aiida_supercell.utils.configurations import estimate_configurations, get_total_charge
+
+    result = {}
+    try:
+        with open(path) as handle:
+            cif_content = handle.read()
+        estimate = estimate_configurations(cif_content, supercell_size, tolerance)
+        result['total_combinations'] = estimate['total_combinations']
+        result['log10_total_combinations'] = estimate['log10_total_combinations']
+        result['total_charge'] = get_total_charge(cif_content, charges)
+    except Exception as exception:  # pylint: disable=broad-except
+        result['error'] = f'{type(exception).__name__}: {exception}'
+    return result
+
+
+def _screen_cif(args):
+    """Unpacks the arguments of `screen_cif` for `Executor.map`."""
+    return screen_cif(*args)
+
+
+def screen_cifs(paths: list, supercell_size: list, tolerance: float = 0.75, charges: dict = None, workers: int = 1):
+    """Runs `screen_cif` over many files, in a pool of `workers` local processes
+
+    Returns:
+        list: Result of `screen_cif` for each path, in order.
+    """
+    arguments = [(path, supercell_size, tolerance, charges) for path in paths]
+    if workers <= 1 or len(paths) <= 1:
+        return [_screen_cif(args) for args in arguments]
+
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        return list(executor.map(_screen_cif, arguments, chunksize=max(1, len(paths) // (4 * workers))))
+
+
+def get_rejection_reason(screening: dict, max_configurations: int = None, require_neutral: bool = True):
+    """Returns why a screened structure should not be submitted, or None if it is tractable
+
+    Structures whose total charge is unknown are not checked for neutrality.
+    """
+    if 'error' in screening:
+        return f'unreadable: {screening["error"]}'
+    if require_neutral and screening['total_charge'] is not None and abs(screening['total_charge']) > CHARGE_TOLERANCE:
+        return f'not charge balanced: total charge {screening["total_charge"]:g}'
+    if max_configurations is not None and screening['total_combinations'] > max_configurations:
+        return f'about 10^{screening["log10_total_combinations"]:.1f} configurations exceed the budget'
+    return None
+
+
+class Progress:
+    """Record of the files already handled by a batch, saved as JSON after each change
+
+    Each entry is keyed by the path of the CIF file and holds the checksum of its content, so that
+    a file changed since it was handled is handled again.
+    """
+
+    def __init__(self, filename: str = None):
+        self.filename = filename
+        self.entries = {}
+        if filename is not None and os.path.isfile(filename):
+            with open(filename) as handle:
+                self.entries = json.load(handle)
+
+    def is_done(self, path: str, checksum: str) -> bool:
+        """Return whether the file was handled with the same content."""
+        return self.entries.get(path, {}).get('checksum') == checksum
+
+    def record(self, path: str, **entry):
+        """Record an entry and save the progress."""
+        self.entries[path] = entry
+        if self.filename is None:
+            return
+        # Write to a temporary file first, so that an interrupted batch never leaves a truncated record
+        with open(f'{self.filename}.tmp', 'w') as handle:
+            json.dump(self.entries, handle, indent=2, sort_keys=True)
+        os.replace(f'{self.filename}.tmp', self.filename)
+
+
+def store_structures(paths: list, checksums: list) -> list:
+    """Stores the CIF files as `SinglefileData` nodes in a single database transaction
+
+    Each node gets the checksum of its file as extra. Files whose checksum is found on a stored node,
+    e.g. stored by an interrupted batch, are not stored again and the stored node is returned instead.
+
+    Args:
+        paths (list): Paths of the CIF files.
+        checksums (list): Checksum of each file, as returned by `_get_checksum`.
+    Returns:
+        list: The `SinglefileData` node of each file.
+    """
+    from aiida.manage.manager import get_manager  # pylint: disable=import-outside-toplevel
+
+    nodes = {}
+    if checksums:
+        builder = orm.QueryBuilder().append(
+            orm.SinglefileData,
+            filters={f'extras.{CHECKSUM_EXTRA}': {'in': sorted(set(checksums))}},
+            project=['*', f'extras.{CHECKSUM_EXTRA}']
+        )
+        for node, checksum in builder.iterall():
+            nodes.setdefault(checksum, node)
+
+    new_nodes = {}
+    for path, checksum in zip(paths, checksums):
+        if checksum not in nodes and checksum not in new_nodes:
+            new_nodes[checksum] = orm.SinglefileData(file=path)
+            new_nodes[checksum].set_extra(CHECKSUM_EXTRA, checksum)
+    with get_manager().get_backend().transaction():
+        for node in new_nodes.values():
+            node.store()
+
+    nodes.update(new_nodes)
+    return [nodes[checksum] for checksum in checksums]
+
+
+def _wait_for_slot(running: list, max_in_flight: int, poll_interval: float) -> list:
+    """Blocks until fewer than `max_in_flight` of the running processes are left, and returns them."""
+    while True:
+        running = [pk for pk in running if not orm.load_node(pk).is_terminated]
+        if len(running) < max_in_flight:
+            return running
+        time.sleep(poll_interval)
+
+
+def run_batch(  # pylint: disable=too-many-arguments,too-many-locals
+    cifs,
+    code: orm.Code,
+    supercell_size: list,
+    inputs: dict = None,
+    max_configurations: int = None,
+    require_neutral: bool = True,
+    max_in_flight: int = 10,
+    progress_file: str = None,
+    workers: int = 1,
+    poll_interval: float = 10.0,
+) -> dict:
+    """Screens many CIF files and submits a `SupercellCalculation` for each tractable one
+
+    The configuration space and the total charge of every file are estimated in a pool of local
+    processes. Files that cannot be read, that are not charge balanced or whose configuration space
+    exceeds `max_configurations` are skipped. The remaining ones are stored in bulk and submitted, with
+    at most `max_in_flight` calculations running at the same time. When `progress_file` is given, the
+    outcome of each file is recorded there and files already handled are left out when the batch is run again.
+    Files stored but not submitted by an interrupted batch are found from their checksum and not stored again.
+
+    Args:
+        cifs: Directory containing CIF files, or list of paths.
+        code (orm.Code): Supercell code.
+        supercell_size (list): Supercell size along the three lattice vectors.
+        inputs (dict): Further inputs of `SupercellCalculation`, shared by all calculations.
+        max_configurations (int): Maximum number of configurations of a tractable structure. Defaults to no limit.
+        require_neutral (bool): Whether structures that are not charge balanced are skipped.
+        max_in_flight (int): Maximum number of calculations running at the same time.
+        progress_file (str): JSON file recording the progress of the batch.
+        workers (int): Number of local processes used for screening.
+        poll_interval (float): Seconds between checks of the running calculations.
+    Returns:
+        dict: The entry of the progress record of each file of this batch.
+    """
+    from aiida.engine import submit  # pylint: disable=import-outside-toplevel
+    from aiida_supercell.calculations import SupercellCalculation  # pylint: disable=import-outside-toplevel
+
+    inputs = dict(inputs or {})
+    charges = inputs['charges'].get_dict() if 'charges' in inputs else None
+    tolerance = inputs['tolerance'].value if 'tolerance' in inputs else 0.75
+
+    paths = collect_cifs(cifs)
+    progress = Progress(progress_file)
+    checksums = {path: _get_checksum(path) for path in paths}
+    pending = [path for path in paths if not progress.is_done(path, checksums[path])]
+
+    tractable = []
+    for path, screening in zip(pending, screen_cifs(pending, supercell_size, tolerance, charges, workers)):
+        reason = get_rejection_reason(screening, max_configurations, require_neutral)
+        if reason is None:
+            tractable.append((path, screening))
+        else:
+            progress.record(path, checksum=checksums[path], status=STATUS_SKIPPED, reason=reason)
+
+    structures = store_structures([path for path, _ in tractable], [checksums[path] for path, _ in tractable])
+    running = []
+    for (path, screening), structure in zip(tractable, structures):
+        running = _wait_for_slot(running, max_in_flight, poll_interval)
+        builder = SupercellCalculation.get_builder()
+        builder.update(inputs)
+        builder.code = code
+        builder.structure = structure
+        builder.supercell_size = orm.List(list=list(supercell_size))
+        node = submit(builder)
+        running.append(node.pk)
+        progress.record(
+            path,
+            checksum=checksums[path],
+            status=STATUS_SUBMITTED,
+            pk=node.pk,
+            structure=structure.uuid,
+            log10_total_combinations=screening['log10_total_combinations'],
+            total_charge=screening['total_charge'],
+        )
+
+    return {path: progress.entries[path] for path in paths}
+
+
+#EOF
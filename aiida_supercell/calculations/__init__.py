@@ -1,12 +1,65 @@
 """AiiDA-Supercell plugin"""
 
 import os
+import shutil
 
 from aiida.engine import CalcJob
-from aiida.plugins import DataFactory
+from aiida.engine.processes.calcjobs.calcjob import validate_calc_job
 from aiida import orm
 from aiida.common import CalcInfo, CodeInfo, exceptions
 
+from aiida_supercell.utils.cache import LRUCache
+from aiida_supercell.utils.cif import order_charge_patterns, write_structure_cif
+from aiida_supercell.utils.symmetry import SYMMETRY_TIERS
+
+# CIF content of `StructureData` inputs, keyed by the hash of the node and the charges
+_CIF_CACHE = LRUCache(maxsize=64)
+
+
+def validate_energy_selection_mode(value, _):
+    """Validate the `energy_selection_mode` option."""
+    if value not in ('low_energy', 'high_energy'):
+        return f'`{value}` is not a valid energy selection mode, use `low_energy` or `high_energy`.'
+    return None
+
+
+def validate_symmetry_tier(value, _):
+    """Validate the `symmetry_tier` option."""
+    if value not in SYMMETRY_TIERS:
+        return f'`{value}` is not a valid symmetry tier, use one of {", ".join(SYMMETRY_TIERS)}.'
+    return None
+
+
+def validate_inputs(value, ctx):
+    """Validate the size of the configuration space against the `max_configurations` option.
+
+    The inputs are first validated by `CalcJob`. Calculations that neither sample structures nor save
+    them as archive are then rejected if the estimated number of configurations exceeds the budget.
+    The check is skipped when the namespace is exposed without some of the ports it needs, e.g. in a
+    workchain which sets them itself.
+    """
+    error = validate_calc_job(value, ctx)
+    if error:
+        return error
+
+    if any(port not in ctx for port in ('structure', 'supercell_size', 'sample_structures', 'save_as_archive')):
+        return None
+
+    budget = value.get('metadata', {}).get('options', {}).get('max_configurations')
+    if budget is None or 'sample_structures' in value:
+        return None
+    if 'save_as_archive' in value and value['save_as_archive'].value:
+        return None
+
+    from aiida_supercell.utils.configurations import estimate_configurations  # pylint: disable=import-outside-toplevel
+    estimate = estimate_configurations(value['structure'], value['supercell_size'], value.get('tolerance', 0.75))
+    if estimate['total_combinations'] > budget:
+        return (
+            f'the estimated number of configurations (about 10^{estimate["log10_total_combinations"]:.1f}) exceeds '
+            f'the budget of {budget}; set `sample_structures` or `save_as_archive`, or increase `max_configurations`.'
+        )
+    return None
+
 
 class SupercellCalculation(CalcJob):
     """
@@ -19,6 +72,16 @@ class SupercellCalculation(CalcJob):
     _OUTPUT_FILE_PREFIX = 'aiida_supercell'
     _OUTPUT_FILE = 'output.log'
     _PARSER = 'supercell'
+    _SAMPLING_FLAGS = {
+        'low_energy': 'l',
+        'high_energy': 'h',
+        'random': 'r',
+        'first': 'f',
+        'last': 'a',
+        'degeneracy': 'w',
+    }
+    # Options that change neither the enumeration nor the outputs, kept as extras so that they are not hashed
+    _HASH_IGNORED_OPTIONS = ('parser_workers', 'max_configurations', 'symmetry_cache_file')
 
     @classmethod
     def define(cls, spec):
@@ -65,8 +128,78 @@ class SupercellCalculation(CalcJob):
             required=False,
             help='How to sample structures from huge configuration space'
         )
+        spec.input(
+            'compact_structures',
+            valid_type=orm.Bool,
+            required=False,
+            help='Whether to store all output structures in a single `output_structures_table` instead of one node each'
+        )
 
         spec.input('metadata.options.withmpi', valid_type=bool, default=False)
+        spec.input(
+            'metadata.options.parser_workers',
+            valid_type=int,
+            default=1,
+            help='Number of processes used by the parser for the symmetry analysis of output structures'
+        )
+        spec.input(
+            'metadata.options.archive_max_structures',
+            valid_type=int,
+            default=0,
+            help='Maximum number of structures to be parsed from the archive when `save_as_archive` is set'
+        )
+        spec.input(
+            'metadata.options.archive_index',
+            valid_type=bool,
+            default=False,
+            help='Whether to index the archive for random access to its structures, which stores a second copy of them'
+        )
+        spec.input(
+            'metadata.options.occupation_vectors',
+            valid_type=bool,
+            default=False,
+            help='Whether to also store the output structures as occupation vectors of the positions of the supercell'
+        )
+        spec.input(
+            'metadata.options.max_configurations',
+            valid_type=int,
+            required=False,
+            help='Maximum estimated number of configurations for runs that neither sample nor archive structures'
+        )
+        spec.input(
+            'metadata.options.energy_selection_size',
+            valid_type=int,
+            default=0,
+            help='Number of structures with extreme Coulomb energies to be kept by the parser, 0 keeps all'
+        )
+        spec.input(
+            'metadata.options.energy_selection_mode',
+            valid_type=str,
+            default='low_energy',
+            validator=validate_energy_selection_mode,
+            help='Whether the parser keeps structures with `low_energy` or `high_energy`'
+        )
+        spec.input(
+            'metadata.options.symmetry_tier',
+            valid_type=str,
+            default='full',
+            validator=validate_symmetry_tier,
+            help='Symmetry analysis of output structures: `none`, `spacegroup-only` or `full`'
+        )
+        spec.input(
+            'metadata.options.symprec',
+            valid_type=float,
+            default=0.01,
+            help='Distance tolerance in Angstroms of the symmetry analysis of output structures'
+        )
+        spec.input(
+            'metadata.options.symmetry_cache_file',
+            valid_type=str,
+            required=False,
+            help='SQLite file, local to the daemon, persisting the symmetry analysis of structures across calculations'
+        )
+
+        spec.inputs.validator = validate_inputs
 
         # Set parser name to the metadata
         spec.input('metadata.options.parser_name', valid_type=str, default=cls._PARSER, non_db=True)
@@ -79,11 +212,42 @@ class SupercellCalculation(CalcJob):
             100, 'ERROR_NO_RETRIEVED_FOLDER', message='The retrieved folder data node could not be accessed.'
         )
         spec.exit_code(101, 'ERROR_ON_INPUT_STRUCTURE', message='Input structure could not be processed.')
+        spec.exit_code(102, 'ERROR_ARCHIVE_READ', message='The archive of output structures could not be read.')
 
         # Output parameters
         spec.output('output_parameters', valid_type=orm.Dict, required=True, help='the results of the calculation')
         spec.output_namespace(
-            'output_structures', valid_type=orm.StructureData, required=True, dynamic=True, help='relaxed structure'
+            'output_structures', valid_type=orm.StructureData, required=False, dynamic=True, help='relaxed structure'
+        )
+        spec.output(
+            'output_structures_table',
+            valid_type=orm.ArrayData,
+            required=False,
+            help='All output structures stacked in arrays, when `compact_structures` is set'
+        )
+        spec.output(
+            'output_coulomb_energies',
+            valid_type=orm.ArrayData,
+            required=False,
+            help='Labels, Coulomb energies and degeneracies of all structures with computed energies'
+        )
+        spec.output(
+            'output_structures_info',
+            valid_type=orm.ArrayData,
+            required=False,
+            help='Degeneracy, symmetry and Coulomb energy of each output structure, one array per field'
+        )
+        spec.output(
+            'output_occupations',
+            valid_type=orm.ArrayData,
+            required=False,
+            help='Output structures encoded as occupation vectors of the positions of the supercell'
+        )
+        spec.output(
+            'output_archive_index',
+            valid_type=orm.ArrayData,
+            required=False,
+            help='Index for random access to the structures of the archive'
         )
 
     # pylint: disable=too-many-statements,too-many-branches
@@ -94,7 +258,8 @@ class SupercellCalculation(CalcJob):
         """
 
         try:
-            self._write_structure(self.inputs.structure, folder)
+            charges = self.inputs.charges.get_dict() if 'charges' in self.inputs else None
+            self._write_structure(self.inputs.structure, folder, charges)
         except exceptions.FailedError:
             self.exit_codes.ERROR_ON_INPUT_STRUCTURE  # pylint: disable=no-member, pointless-statement
 
@@ -116,34 +281,25 @@ class SupercellCalculation(CalcJob):
             cmdline_arguments.append('-g')
             cmdline_arguments.append(f'-c {self.inputs.charge_balance_method.value}')
 
-        if 'random_seed' in self.inputs:
+        if self._uses_random_seed():
             cmdline_arguments.append(f'--random-seed={self.inputs.random_seed.value}')
+        elif 'random_seed' in self.inputs:
+            self.report(
+                f'random_seed {self.inputs.random_seed.value} is not used without `random` sampling and was not '
+                'linked to the calculation'
+            )
 
+        # Supercell applies the patterns in order and the last match wins, so they are given from the lowest to
+        # the highest precedence, which does not depend on the order of the keys, as the hash of the `Dict`.
         if 'charges' in self.inputs:
             charges = self.inputs.charges.get_dict()
-            for key, value in charges.items():
-                arg = '-p ' + key + ':c=' + str(value)
-                cmdline_arguments.append(arg)
+            for key in order_charge_patterns(charges):
+                cmdline_arguments.append(f'-p {key}:c={float(charges[key]):.12g}')
         if 'sample_structures' in self.inputs:
-            for key, value in self.inputs.sample_structures.get_dict().items():
-                if key == 'low_energy':
-                    cmdline_arguments.append('-n')
-                    cmdline_arguments.append(f'l{value}')
-                if key == 'high_energy':
-                    cmdline_arguments.append('-n')
-                    cmdline_arguments.append(f'h{value}')
-                if key == 'random':
-                    cmdline_arguments.append('-n')
-                    cmdline_arguments.append(f'r{value}')
-                if key == 'first':
+            for key, value in sorted(self.inputs.sample_structures.get_dict().items()):
+                if key in self._SAMPLING_FLAGS:
                     cmdline_arguments.append('-n')
-                    cmdline_arguments.append(f'f{value}')
-                if key == 'last':
-                    cmdline_arguments.append('-n')
-                    cmdline_arguments.append(f'a{value}')
-                if key == 'degeneracy':
-                    cmdline_arguments.append('-n')
-                    cmdline_arguments.append(f'w{value}')
+                    cmdline_arguments.append(f'{self._SAMPLING_FLAGS[key]}{value}')
 
         if not self.inputs.save_as_archive:
             cmdline_arguments.append('-o')
@@ -179,17 +335,69 @@ class SupercellCalculation(CalcJob):
 
         return calcinfo
 
+    def _uses_random_seed(self):
+        """Return whether `random_seed` has an effect, i.e. whether structures are sampled at random."""
+        if 'random_seed' not in self.inputs or 'sample_structures' not in self.inputs:
+            return False
+        return 'random' in self.inputs.sample_structures.get_dict()
+
+    def _flat_inputs(self):
+        """Return the inputs to be linked to the node
+
+        All sampling modes but `random`, including `degeneracy`, are deterministic. Without random sampling,
+        `random_seed` is neither passed to Supercell nor linked, so that it is not part of the hash of the
+        calculation, even when the node is rehashed. Identical enumerations can then be taken from the cache
+        regardless of the seed they were given. The seed left out is reported when the calculation is submitted.
+        """
+        inputs = super()._flat_inputs()
+        if not self._uses_random_seed():
+            inputs.pop('random_seed', None)
+        return inputs
+
+    def _setup_db_record(self):
+        """Set up the database record of the calculation
+
+        The options that do not change the results are moved from the attributes to the extras of the node,
+        which are not hashed, so that they do not prevent caching.
+        """
+        super()._setup_db_record()
+        for option in self._HASH_IGNORED_OPTIONS:
+            if option in self.node.attributes:
+                self.node.set_extra(option, self.node.get_attribute(option))
+                self.node.delete_attribute(option)
+
+    def update_outputs(self):
+        """Attach the new outputs to the node in a single database transaction
+
+        The engine links and stores the outputs one by one, each node in its own transaction, which
+        dominates the time to finish a calculation with many `output_structures`. Within one transaction,
+        the outputs are committed at once, and a failure rolls all of them back, leaving no orphan nodes.
+        """
+        from aiida.manage.manager import get_manager  # pylint: disable=import-outside-toplevel
+
+        with get_manager().get_backend().transaction():
+            super().update_outputs()
+
     @staticmethod
-    def _write_structure(structure, folder):
-        """Function that writes a structure and takes care of element tags"""
-        path = os.path.join(folder.get_abs_path('aiida.cif'))
+    def _write_structure(structure, folder, charges=None):
+        """Function that writes a structure and takes care of element tags
+
+        `SinglefileData` is streamed to the input file. `StructureData` is written with its kind names
+        as site labels and the `charges` as oxidation numbers, see `write_structure_cif`. Its CIF is
+        cached by the hash of the node, so that calculations on the same structure convert it only once.
+        """
+        path = folder.get_abs_path(SupercellCalculation._INPUT_FILE)
         if isinstance(structure, orm.SinglefileData):
-            cif_content = structure.get_content()
+            with structure.open(mode='rb') as source, open(path, mode='wb') as fobj:
+                shutil.copyfileobj(source, fobj)
+        elif isinstance(structure, orm.StructureData):
+            key = (structure.get_hash(), tuple(sorted(charges.items())) if charges else None)
+            cif_content = _CIF_CACHE.get(key)
+            if cif_content is None:
+                cif_content = write_structure_cif(structure, charges)
+                _CIF_CACHE.put(key, cif_content)
             with open(path, mode='w') as fobj:
                 fobj.write(cif_content)
-        elif isinstance(structure, orm.StructureData):
-            strc_pmg = structure.get_pymatgen_structure()
-            strc_pmg.to(fmt='cif', filename=path)
 
 
 #EOF
@@ -0,0 +1,122 @@
+"""AiiDA-Supercell plugin -- Resampling of structures from an already retrieved calculation"""
+
+import random
+
+from aiida import orm
+from aiida.engine import ExitCode, calcfunction
+
+from aiida_supercell.utils.archive import ArchiveIndex, iterate_archive, parse_archive, parse_structure_name
+from aiida_supercell.utils.energies import iterate_energies
+from aiida_supercell.utils.sampling import sample_records
+from aiida_supercell.utils.structures import get_structure_node, get_structures_info
+from aiida_supercell.utils.symmetry import analyze_structures
+
+OUTPUT_FOLDER = 'Output'
+ARCHIVE_FILE = 'aiida_supercell.tar.gz'
+ENERGY_FILE_PREFIX = 'aiida_supercell_coulomb_energy_'
+
+
+def _iterate_records(retrieved: orm.FolderData, archive_index: orm.ArrayData = None):
+    """Streams the label, energy and degeneracy of every structure of a retrieved calculation
+
+    Energies are read from the Coulomb energy files when there are any. Otherwise records come
+    from the archive index, the names of the archive members or the names of the retrieved CIFs,
+    without energies.
+    """
+    names = retrieved.list_object_names(OUTPUT_FOLDER)
+    energy_files = [name for name in names if ENERGY_FILE_PREFIX in name]
+    if energy_files:
+        for name in energy_files:
+            with retrieved.open(name) as handle:
+                yield from iterate_energies(handle)
+    elif archive_index is not None:
+        index = ArchiveIndex(archive_index)
+        for label in index.labels:
+            yield label, None, index.get_degeneracy(label)
+    elif ARCHIVE_FILE in names:
+        with retrieved.open(f'{OUTPUT_FOLDER}/{ARCHIVE_FILE}', mode='rb') as handle:
+            for _, member in iterate_archive(handle):
+                label, degeneracy = parse_structure_name(member.name)
+                yield label, None, degeneracy
+    else:
+        for name in sorted(name for name in names if name.endswith('.cif')):
+            label, degeneracy = parse_structure_name(name)
+            yield label, None, degeneracy
+
+
+def _read_cifs(retrieved: orm.FolderData, labels: set, archive_index: orm.ArrayData = None) -> dict:
+    """Reads the CIF contents of the structures with the given labels, and only those."""
+    if archive_index is not None:
+        index = ArchiveIndex(archive_index)
+        return index.get_cifs([label for label in labels if label in index])
+
+    names = retrieved.list_object_names(OUTPUT_FOLDER)
+    if ARCHIVE_FILE in names:
+        with retrieved.open(f'{OUTPUT_FOLDER}/{ARCHIVE_FILE}', mode='rb') as handle:
+            _, structures = parse_archive(handle, labels=labels)
+        return {parse_structure_name(name)[0]: content for name, content in structures}
+
+    cifs = {}
+    for name in names:
+        label = parse_structure_name(name)[0] if name.endswith('.cif') else None
+        if label in labels:
+            cifs[label] = retrieved.get_object_content(f'{OUTPUT_FOLDER}/{name}')
+    return cifs
+
+
+@calcfunction
+def resample_structures(retrieved, sample_structures, random_seed=None, archive_index=None):
+    """Samples structures again from the outputs of a finished `SupercellCalculation`, without running Supercell
+
+    The modes of `sample_structures` are the same as for `SupercellCalculation`. The records of all
+    structures are streamed in a single pass and only the sampled structures are read from the archive,
+    through `archive_index` when given.
+
+    Args:
+        retrieved (orm.FolderData): The `retrieved` output of the calculation.
+        sample_structures (orm.Dict): Number of structures to sample for each mode.
+        random_seed (orm.Int): Seed of the `random` mode. Drawn at random, and reported, if not given.
+        archive_index (orm.ArrayData): The `output_archive_index` of the calculation, if any.
+    Returns:
+        dict: `output_parameters` with the labels sampled by each mode, `output_structures_info` and
+        one `structure_<label>` `StructureData` per sampled structure.
+    """
+    seed = random_seed.value if random_seed is not None else random.SystemRandom().randint(1, 2**31 - 1)
+    try:
+        sampled = sample_records(_iterate_records(retrieved, archive_index), sample_structures.get_dict(), seed)
+    except ValueError as exception:
+        return ExitCode(300, str(exception))
+
+    # A structure sampled by several modes is only read and stored once
+    records = {}
+    for mode_records in sampled.values():
+        records.update((record[0], record) for record in mode_records)
+    labels = list(records)
+    cifs = _read_cifs(retrieved, set(labels), archive_index)
+    missing = [label for label in labels if label not in cifs]
+    if missing:
+        return ExitCode(301, f'structures {", ".join(missing)} are not part of the retrieved files')
+
+    energies = [records[label][1] for label in labels]
+    analyzed = analyze_structures([cifs[label] for label in labels], tier='none')
+    results = {
+        'output_parameters':
+        orm.Dict(
+            dict={
+                'Sampled_structures': {mode: [record[0] for record in mode_records]
+                                       for mode, mode_records in sampled.items()},
+                'Random_seed': seed,
+            }
+        ),
+        'output_structures_info':
+        get_structures_info(
+            labels, [records[label][2] for label in labels], [{} for _ in labels],
+            energies if None not in energies else None
+        ),
+    }
+    for label, (arrays, _) in zip(labels, analyzed):
+        results[f'structure_{label}'] = get_structure_node(*arrays)
+    return results
+
+
+#EOF
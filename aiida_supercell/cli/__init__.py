@@ -0,0 +1,78 @@
+"""AiiDA-Supercell plugin -- Command line interface"""
+
+import json
+
+import click
+
+from aiida.cmdline.params import options, types
+from aiida.cmdline.utils import decorators, echo
+
+
+@click.group('aiida-supercell')
+@options.PROFILE()
+def cli(profile):
+    """Command line interface of aiida-supercell"""
+    from aiida import load_profile  # pylint: disable=import-outside-toplevel
+    load_profile(profile.name if profile else None)
+
+
+@cli.command('batch')
+@click.argument('cifs', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('-X', '--code', type=types.CodeParamType(), required=True, help='Supercell code.')
+@click.option('-s', '--supercell-size', nargs=3, type=int, required=True, help='Supercell size, e.g. `1 1 2`.')
+@click.option('-c', '--charges', type=str, help='Formal charges as JSON, e.g. `{"Ca*": 2, "O*": -2}`.')
+@click.option('-t', '--tolerance', type=float, default=0.75, show_default=True, help='Site grouping tolerance.')
+@click.option('--max-configurations', type=int, help='Skip structures with more configurations.')
+@click.option('--allow-charged', is_flag=True, help='Do not skip structures that are not charge balanced.')
+@click.option('--sample-structures', type=str, help='Sampling request as JSON, e.g. `{"random": 10}`.')
+@click.option('--max-in-flight', type=int, default=10, show_default=True, help='Maximum number of running jobs.')
+@click.option('--progress-file', type=click.Path(dir_okay=False), help='JSON file to record and resume progress.')
+@click.option('-w', '--workers', type=int, default=1, show_default=True, help='Number of screening processes.')
+@click.option('--max-wallclock-seconds', type=int, default=1800, show_default=True)
+@decorators.with_dbenv()
+def batch(  # pylint: disable=too-many-arguments
+    cifs, code, supercell_size, charges, tolerance, max_configurations, allow_charged, sample_structures,
+    max_in_flight, progress_file, workers, max_wallclock_seconds
+):
+    """Screen CIF files, or directories of CIF files, and submit the tractable ones."""
+    # pylint: disable=import-outside-toplevel
+    from aiida import orm
+    from aiida_supercell.batch import collect_cifs, run_batch
+
+    inputs = {
+        'tolerance': orm.Float(tolerance),
+        'metadata': {
+            'options': {
+                'resources': {
+                    'num_machines': 1,
+                    'num_mpiprocs_per_machine': 1,
+                },
+                'max_wallclock_seconds': max_wallclock_seconds,
+            }
+        },
+    }
+    if charges:
+        inputs['charges'] = orm.Dict(dict=json.loads(charges))
+    if sample_structures:
+        inputs['sample_structures'] = orm.Dict(dict=json.loads(sample_structures))
+
+    paths = [path for cif in cifs for path in collect_cifs(cif)]
+    entries = run_batch(
+        paths,
+        code,
+        list(supercell_size),
+        inputs=inputs,
+        max_configurations=max_configurations,
+        require_neutral=not allow_charged,
+        max_in_flight=max_in_flight,
+        progress_file=progress_file,
+        workers=workers,
+    )
+    for path, entry in entries.items():
+        if entry['status'] == 'submitted':
+            echo.echo_success(f'{path}: submitted <{entry["pk"]}>')
+        else:
+            echo.echo_warning(f'{path}: {entry["status"]}, {entry.get("reason", "")}')
+
+
+#EOF
@@ -1,19 +1,32 @@
 """AiiDA-Supecell plugin -- Supercell Parser"""
 
-from collections import defaultdict
-from pymatgen.core import Structure
-from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+import tarfile
+import tempfile
+import numpy as np
 
 from aiida.common import exceptions
 from aiida.parsers import Parser
 from aiida import orm
 from aiida.engine import ExitCode
 from aiida_supercell.utils import parse_supercell_output
+from aiida_supercell.utils.archive import ArchiveIndexBuilder, parse_archive, parse_structure_name
+from aiida_supercell.utils.duplicates import tag_structures_info
+from aiida_supercell.utils.energies import (
+    get_energy_table, histogram_energies, iterate_energy_chunks, load_energies, select_energies, summarize_energies
+)
+from aiida_supercell.utils.fingerprint import get_fingerprint
+from aiida_supercell.utils.occupations import build_template, get_occupation_table
+from aiida_supercell.utils.structures import (
+    get_structure_node, get_structure_table, get_structures_info
+)
+from aiida_supercell.utils.symmetry import analyze_structures
 
 
 class SupercellParser(Parser):
     """Parser for Supercell Calculations"""
 
+    _ARCHIVE_FILE = 'aiida_supercell.tar.gz'
+
     def parse(self, **kwargs):
         """Receives in input a dictionary of retrieved nodes. Does all the logic here.
         """
@@ -29,7 +42,7 @@ class SupercellParser(Parser):
 
         return ExitCode(0)
 
-    def _parse_stdout(self):  # pylint: disable=too-many-locals
+    def _parse_stdout(self):  # pylint: disable=too-many-locals,too-many-return-statements,too-many-statements
         """Supercell Basic Output parser"""
 
         fname = self.node.get_attribute('output_filename')
@@ -37,11 +50,6 @@ class SupercellParser(Parser):
         if fname not in self.retrieved.list_object_names():
             return self.exit_codes.ERROR_OUTPUT_STDOUT_MISSING
 
-        try:
-            output_string = self.retrieved.get_object_content(fname)
-        except IOError:
-            return self.exit_codes.ERROR_OUTPUT_STDOUT_READ
-
         output_list = self.retrieved.list_object_names(path='Output')
 
         enrg_outputs = []
@@ -49,47 +57,117 @@ class SupercellParser(Parser):
             if 'aiida_supercell_coulomb_energy_' in o:
                 enrg_outputs.append(o)
 
-        result_dict = parse_supercell_output(output_string)
+        try:
+            with self.retrieved.open(fname) as handle:
+                result_dict = parse_supercell_output(handle)
+        except IOError:
+            return self.exit_codes.ERROR_OUTPUT_STDOUT_READ
 
-        s_dict = defaultdict(dict)
-        res_dict = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+        s_dict = {}
+        res_dict = {}
 
+        energy_table = None
+        selected = None
         if len(enrg_outputs) > 0:
             res_dict['coulombic_energy_unit'] = 'eV'
-            enrg_content = ''
-            for item in enrg_outputs:
-                enrg_content += self.retrieved.get_object_content(item)
-
-            for i in enrg_content.split('\n')[:-1]:
-                sp = i.split()
-                enrg = float(sp[1])
-                label = sp[0].split('_')[2]
-                res_dict['Structures_info'][label]['coulombic_energy'] = enrg
-
-        for s in output_list:
-            if s[-3:] == 'cif':
-                sp = s.split('_')
-                label = sp[2]
-                degneracy = sp[-1].split('.')[0][1:]
-
-                s_content = self.retrieved.get_object_content(f'Output/{s}')
-                s_pmg = Structure.from_str(s_content, fmt='cif')
-                s_pmg.sort()
-
-                spg = SpacegroupAnalyzer(s_pmg)
-                res_dict['Structures_info'][label]['degeneracy'] = int(degneracy)
-                res_dict['Structures_info'][label]['crystal_system'] = spg.get_crystal_system()
-                res_dict['Structures_info'][label]['lattice_type'] = spg.get_lattice_type()
-                res_dict['Structures_info'][label]['space_group_symbol'] = spg.get_space_group_symbol()
-
-                s_dict[label] = orm.StructureData(pymatgen_structure=s_pmg)
+            selection_size = self.node.get_attribute('energy_selection_size', 0)
+            if selection_size > 0:
+                selection_mode = self.node.get_attribute('energy_selection_mode', 'low_energy')
+                labels, energies, degeneracies, summary = select_energies(
+                    self._iterate_energy_chunks(enrg_outputs), selection_size, selection_mode
+                )
+                energy_table = (labels, energies, degeneracies)
+                selected = {label.decode() for label in labels.tolist()}
+                if summary['number_of_structures']:
+                    # The bins are only known once all energies are seen, so the files are streamed again
+                    summary['histogram'] = histogram_energies(
+                        self._iterate_energy_chunks(enrg_outputs), summary['min'], summary['max']
+                    )
+            else:
+                energy_table = load_energies(self._iterate_energy_chunks(enrg_outputs))
+                summary = summarize_energies(energy_table[1], energy_table[2])
+            res_dict['Coulomb_energies'] = summary
+            self.out('output_coulomb_energies', get_energy_table(*energy_table))
+
+        # Sorting keeps the order of output labels fixed, whether or not a pool is used
+        cif_outputs = []
+        for s in sorted(output_list):
+            if s[-3:] == 'cif' and (selected is None or parse_structure_name(s)[0] in selected):
+                cif_outputs.append((s, self.retrieved.get_object_content(f'Output/{s}')))
+
+        if self._ARCHIVE_FILE in output_list:
+            max_structures = self.node.get_attribute('archive_max_structures', 0)
+            build_index = self.node.get_attribute('archive_index', False)
+            try:
+                with self.retrieved.open(f'Output/{self._ARCHIVE_FILE}', mode='rb') as handle, \
+                        tempfile.TemporaryFile() as index_data:
+                    index_builder = ArchiveIndexBuilder(index_data) if build_index else None
+                    archive_info, archive_outputs = parse_archive(handle, max_structures, index_builder, selected)
+                    if index_builder is not None:
+                        self.out('output_archive_index', index_builder.get_node())
+            except (IOError, tarfile.TarError, ValueError, IndexError):
+                return self.exit_codes.ERROR_ARCHIVE_READ
+            res_dict['Archive_info'] = archive_info
+            cif_outputs += archive_outputs
+
+        workers = self.node.get_extra('parser_workers', 1)
+        analyzed = analyze_structures([content for _, content in cif_outputs],
+                                      workers,
+                                      tier=self.node.get_attribute('symmetry_tier', 'full'),
+                                      symprec=self.node.get_attribute('symprec', 0.01),
+                                      cache_file=self.node.get_extra('symmetry_cache_file', None))
+
+        compact = 'compact_structures' in self.node.inputs and self.node.inputs.compact_structures.value
+        names = [parse_structure_name(s) for s, _ in cif_outputs]
+        for (label, _), (arrays, _) in zip(names, analyzed):
+            s_dict[label] = arrays if compact else get_structure_node(*arrays)
+
+        if analyzed:
+            if self.node.get_attribute('occupation_vectors', False):
+                try:
+                    template, site_types = build_template(
+                        self.node.inputs.structure, self.node.inputs.supercell_size.get_list()
+                    )
+                    self.out(
+                        'output_occupations',
+                        get_occupation_table(list(s_dict), [arrays for arrays, _ in analyzed], template, site_types)
+                    )
+                except ValueError as exception:
+                    self.logger.warning(f'structures could not be encoded as occupation vectors: {exception}')
+
+            # Energies of the output structures, NaN for those missing from the energy files
+            coulomb_energies = None
+            if energy_table is not None:
+                labels, energies, _ = energy_table
+                positions = {label: i for i, label in enumerate(s_dict)}
+                coulomb_energies = np.full(len(positions), np.nan)
+                mask = np.isin(labels, np.array(list(positions), dtype=np.bytes_))
+                for label, energy in zip(labels[mask].tolist(), energies[mask].tolist()):
+                    coulomb_energies[positions[label.decode()]] = energy
+
+            structures_info = get_structures_info(
+                list(s_dict), [degeneracy for _, degeneracy in names], [info for _, info in analyzed],
+                coulomb_energies, [get_fingerprint(*arrays) for arrays, _ in analyzed]
+            )
+            tag_structures_info(structures_info, self.node.inputs.structure, self.node.inputs.supercell_size.get_list())
+            self.out('output_structures_info', structures_info)
 
         result_dict.update(res_dict)
 
         self.out('output_parameters', orm.Dict(dict=result_dict))
+        if compact:
+            self.out('output_structures_table', get_structure_table(list(s_dict), list(s_dict.values())))
+            return None
+
         for key, value in s_dict.items():
             self.out(f'output_structures.{key}', value)
         return None
 
+    def _iterate_energy_chunks(self, enrg_outputs):
+        """Streams the chunks of all Coulomb energy files"""
+        for item in enrg_outputs:
+            with self.retrieved.open(item) as handle:
+                yield from iterate_energy_chunks(handle)
+
 
 #EOF
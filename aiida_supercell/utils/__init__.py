@@ -1,69 +1,106 @@
 """Parser function for Supercell outputs"""
 
-from collections import defaultdict
+import re
+from typing import Iterable, Union
 
+# A single pass over each line finds which, if any, of the known records it holds.
+_RECORD_PATTERN = re.compile(
+    r'(?P<site>Site)'
+    r'|(?P<random_seed>Random SEED:)'
+    r'|(?P<initial_formula>Chemical Formula)'
+    r'|(?P<supercell_formula>Chemical formula of the supercell)'
+    r'|(?P<total_charge>Total charge of supercell)'
+    r'|(?P<total_combinations>The total number of combinations is)'
+    r'|(?P<symmetry_operations>symmetry operation found for supercell)'
+    r'|(?P<distinct_combinations>Combinations after merge)'
+)
 
-def parse_supercell_output(output_string: str) -> dict:  #pylint: disable=too-many-branches
+
+def _parse_random_seed(output_dict, sp):
+    output_dict['Random_seed'] = int(sp[-1])
+
+
+def _parse_initial_formula(output_dict, sp):
+    output_dict.setdefault('Chemical_formula', {})['Initial'] = ''.join(sp[2:])
+
+
+def _parse_supercell_formula(output_dict, sp):
+    output_dict.setdefault('Chemical_formula', {})['Supercell'] = ''.join(sp[5:])
+
+
+def _parse_total_charge(output_dict, sp):
+    chg = int(sp[-1])
+    output_dict['Supecell_total_charge'] = chg
+    if chg != 0:
+        output_dict['WARNING'] = 'Supercell is NOT charge balanced!'
+
+
+def _parse_total_combinations(output_dict, sp):
+    output_dict.setdefault('Number_of_structures', {})['total_combinations'] = int(sp[-1].split('(')[0])
+
+
+def _parse_symmetry_operations(output_dict, sp):
+    output_dict['Number_of_symmetry_operations'] = int(sp[0])
+
+
+def _parse_distinct_combinations(output_dict, sp):
+    output_dict.setdefault('Number_of_structures', {})['symmetrically_distinct'] = int(sp[-1])
+
+
+_RECORD_HANDLERS = {
+    'random_seed': _parse_random_seed,
+    'initial_formula': _parse_initial_formula,
+    'supercell_formula': _parse_supercell_formula,
+    'total_charge': _parse_total_charge,
+    'total_combinations': _parse_total_combinations,
+    'symmetry_operations': _parse_symmetry_operations,
+    'distinct_combinations': _parse_distinct_combinations,
+}
+
+
+def parse_supercell_output(output: Union[str, Iterable[str]]) -> dict:
     """Parses output of supercell `output.log` file
 
     Args:
-        output_string (str): Content of OUTPUT.log as string
+        output (str or iterable): Content of OUTPUT.log as string, or an iterable of its lines
+            such as an open file handle, which is consumed line by line.
     Returns:
         dict: Dictionary of parsed and selected results.
     """
+    output_dict = {}
+    groups = None
+    group = None
     group_counter = 0
-    lines = output_string.splitlines()
+    search = _RECORD_PATTERN.search
 
-    output_dict = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(dict))))
+    lines = output.splitlines() if isinstance(output, str) else output
     for line in lines:
-        if 'Random SEED:' in line:
-            rs = int(line.split()[-1])
-            output_dict['Random_seed'] = rs
-        if 'Chemical Formula' in line:
-            output_dict['Chemical_formula']['Initial'] = ''.join(line.split()[2:])
-        if 'Chemical formula of the supercell' in line:
-            output_dict['Chemical_formula']['Supercell'] = ''.join(line.split()[5:])
-
-        if 'Total charge of supercell' in line:
-            chg = int(line.split()[-1])
-            output_dict['Supecell_total_charge'] = chg
-            if chg != 0:
-                output_dict['WARNING'] = 'Supercell is NOT charge balanced!'
-
-        if 'The total number of combinations is' in line:
-            num = line.split()[-1]
-            if '(' in num:
-                output_dict['Number_of_structures']['total_combinations'] = int(line.split()[-1].split('(')[0])
-            else:
-                output_dict['Number_of_structures']['total_combinations'] = int(line.split()[-1])
-        if 'symmetry operation found for supercell' in line:
-            output_dict['Number_of_symmetry_operations'] = int(line.split()[0])
-        if 'Combinations after merge' in line:
-            output_dict['Number_of_structures']['symmetrically_distinct'] = int(line.split()[-1])
-
-        if 'Site' in line:
-            sp = line.split()
-            if sp[2] == '#1:':
-                group_counter += 1
-            site = sp[2][1]
-            output_dict['Crystallographic_groups'][f'Group{group_counter}'][f'Site{site}']['Symbol'] = sp[3]
-            output_dict['Crystallographic_groups'][f'Group{group_counter}'][f'Site{site}']['Type'] = sp[7]
-            if sp[7] == 'distributed':
-                d = {}
-                d['considered_sites'] = sp[9]
-                d['total_sites'] = sp[13]
-                output_dict['Crystallographic_groups'][f'Group{group_counter}'][f'Site{site}'].update({
-                    'Type': {
-                        'distributed': d
-                    }
-                })
-
-            output_dict['Crystallographic_groups'][f'Group{group_counter}'][f'Site{site}']['Initial_occupancy'] = float(
-                sp[5].strip(')')
-            )
-            output_dict['Crystallographic_groups'][f'Group{group_counter}'][f'Site{site}']['Actual_occupancy'] = float(
-                sp[-1][:-1].strip(')')
-            )
+        match = search(line)
+        if match is None:
+            continue
+
+        sp = line.split()
+        record = match.lastgroup
+        if record != 'site':
+            _RECORD_HANDLERS[record](output_dict, sp)
+            continue
+
+        if groups is None:
+            groups = output_dict.setdefault('Crystallographic_groups', {})
+        if sp[2] == '#1:':
+            group_counter += 1
+            group = None
+        if group is None:
+            group = groups.setdefault(f'Group{group_counter}', {})
+
+        site = group.setdefault(f'Site{sp[2][1]}', {})
+        site['Symbol'] = sp[3]
+        if sp[7] == 'distributed':
+            site['Type'] = {'distributed': {'considered_sites': sp[9], 'total_sites': sp[13]}}
+        else:
+            site['Type'] = sp[7]
+        site['Initial_occupancy'] = float(sp[5].strip(')'))
+        site['Actual_occupancy'] = float(sp[-1][:-1].strip(')'))
 
     return output_dict
 
@@ -0,0 +1,216 @@
+"""Utilities to read structure archives written by Supercell"""
+
+import posixpath
+import tarfile
+import zlib
+from array import array
+
+import numpy as np
+
+from aiida import orm
+
+INDEX_DATA_FILE = 'structures.bin'
+
+
+def parse_structure_name(name: str) -> tuple:
+    """Extracts label and degeneracy from the name of a structure written by Supercell
+
+    Args:
+        name (str): File name such as `aiida_supercell_i01_w4.cif`, optionally with a leading path.
+    Returns:
+        tuple: Label (str) and degeneracy (int) of the structure.
+    """
+    sp = posixpath.basename(name).split('_')
+    return sp[2], int(sp[-1].split('.')[0][1:])
+
+
+def iterate_archive(handle):
+    """Walks over the CIF members of a Supercell archive in stream mode
+
+    The archive is decompressed on the fly while reading from `handle`, therefore it is
+    neither extracted to disk nor loaded into memory as a whole. Visited members are not
+    kept by the `TarFile` object, so memory does not grow with the size of the archive.
+
+    Args:
+        handle: Binary file handle of `aiida_supercell.tar.gz`.
+    Yields:
+        tuple: Open `TarFile` and `TarInfo` of each CIF member. The content of the member
+            can be read with `archive.extractfile(member)` before advancing the iteration.
+    """
+    with tarfile.open(fileobj=handle, mode='r|gz') as archive:
+        while True:
+            member = archive.next()
+            if member is None:
+                break
+            archive.members = []
+            if member.isfile() and member.name.endswith('.cif'):
+                yield archive, member
+
+
+def parse_archive(handle, max_structures: int = 0, index_builder=None, labels=None) -> tuple:
+    """Collects summary statistics of a Supercell archive in a single streaming pass
+
+    Args:
+        handle: Binary file handle of `aiida_supercell.tar.gz`.
+        max_structures (int): Maximum number of structures whose content is returned.
+            Structures are taken in the order they are stored in the archive. Defaults to 0.
+        index_builder (ArchiveIndexBuilder): If given, every member is added to the index.
+        labels (set): Labels of structures whose content is returned in addition to the first
+            `max_structures` ones.
+    Returns:
+        tuple: Dictionary of summary statistics and list of `(name, cif_content)` tuples.
+    """
+    count = 0
+    total_degeneracy = 0
+    min_degeneracy = None
+    max_degeneracy = None
+    structures = []
+    labels = labels or set()
+
+    for archive, member in iterate_archive(handle):
+        label, degeneracy = parse_structure_name(member.name)
+        count += 1
+        total_degeneracy += degeneracy
+        min_degeneracy = degeneracy if min_degeneracy is None else min(min_degeneracy, degeneracy)
+        max_degeneracy = degeneracy if max_degeneracy is None else max(max_degeneracy, degeneracy)
+
+        requested = count <= max_structures or label in labels
+        if index_builder is None and not requested:
+            continue
+
+        content = archive.extractfile(member).read()
+        if index_builder is not None:
+            index_builder.add(member.name, content)
+        if requested:
+            structures.append((posixpath.basename(member.name), content.decode('utf-8')))
+
+    summary = {
+        'number_of_structures': count,
+        'total_degeneracy': total_degeneracy,
+        'min_degeneracy': min_degeneracy,
+        'max_degeneracy': max_degeneracy,
+    }
+    return summary, structures
+
+
+class ArchiveIndexBuilder:
+    """Builds a random access index over the members of a Supercell archive
+
+    A gzipped tarball cannot be read from an arbitrary position, therefore each member is
+    compressed on its own into the data file of the index. Since all CIFs written by Supercell
+    share the same layout, the first member is used as preset dictionary. The data file is a
+    second copy of the structures, about as large as the archive itself. The offset and size of
+    every compressed member are recorded, so a single structure can later be read with one seek.
+
+    Args:
+        data_handle: Writable binary file handle where compressed members are stored.
+    """
+
+    def __init__(self, data_handle):
+        self._data_handle = data_handle
+        self._dictionary = None
+        self._labels = []
+        self._degeneracies = array('q')
+        self._offsets = array('q')
+        self._sizes = array('q')
+        self._position = 0
+
+    def add(self, name: str, content: bytes):
+        """Compresses and appends a member to the index."""
+        if self._dictionary is None:
+            self._dictionary = content[:32768]
+        compressor = zlib.compressobj(zdict=self._dictionary)
+        compressed = compressor.compress(content) + compressor.flush()
+        self._data_handle.write(compressed)
+
+        label, degeneracy = parse_structure_name(name)
+        self._labels.append(label)
+        self._degeneracies.append(degeneracy)
+        self._offsets.append(self._position)
+        self._sizes.append(len(compressed))
+        self._position += len(compressed)
+
+    def get_node(self) -> orm.ArrayData:
+        """Returns the index as an unstored `ArrayData` including the data file."""
+        node = orm.ArrayData()
+        node.set_array('labels', np.array(self._labels, dtype=str))
+        node.set_array('degeneracies', np.frombuffer(self._degeneracies, dtype=np.int64))
+        node.set_array('offsets', np.frombuffer(self._offsets, dtype=np.int64))
+        node.set_array('sizes', np.frombuffer(self._sizes, dtype=np.int64))
+        node.set_array('dictionary', np.frombuffer(self._dictionary or b'', dtype=np.uint8))
+
+        self._data_handle.flush()
+        self._data_handle.seek(0)
+        node.put_object_from_filelike(self._data_handle, INDEX_DATA_FILE, mode='wb', encoding=None)
+        return node
+
+
+class ArchiveIndex:
+    """Random access to the structures of a Supercell archive through its index
+
+    Args:
+        node (orm.ArrayData): Index node created by the parser as `output_archive_index`.
+    """
+
+    def __init__(self, node: orm.ArrayData):
+        self._node = node
+        self._labels = [str(label) for label in node.get_array('labels')]
+        self._positions = {label: i for i, label in enumerate(self._labels)}
+        self._degeneracies = node.get_array('degeneracies')
+        self._offsets = node.get_array('offsets')
+        self._sizes = node.get_array('sizes')
+        self._dictionary = node.get_array('dictionary').tobytes()
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __contains__(self, label):
+        return label in self._positions
+
+    @property
+    def labels(self) -> list:
+        """Labels of all structures in the order they are stored in the archive."""
+        return list(self._labels)
+
+    def get_degeneracy(self, label: str) -> int:
+        """Returns the degeneracy of a structure."""
+        return int(self._degeneracies[self._positions[label]])
+
+    def get_cif(self, label: str) -> str:
+        """Returns the CIF content of a single structure."""
+        return self.get_cifs([label])[label]
+
+    def get_cifs(self, labels: list) -> dict:
+        """Returns the CIF contents of a batch of structures.
+
+        Members are read in the order they are stored, with a single open file handle.
+        """
+        positions = sorted(self._positions[label] for label in labels)
+        cifs = {}
+        with self._node.open(INDEX_DATA_FILE, mode='rb') as handle:
+            for i in positions:
+                handle.seek(int(self._offsets[i]))
+                decompressor = zlib.decompressobj(zdict=self._dictionary)
+                content = decompressor.decompress(handle.read(int(self._sizes[i]))) + decompressor.flush()
+                cifs[self._labels[i]] = content.decode('utf-8')
+        return {label: cifs[label] for label in labels}
+
+    def get_structure(self, label: str) -> orm.StructureData:
+        """Returns a single structure as unstored `StructureData`."""
+        return self.get_structures([label])[label]
+
+    def get_structures(self, labels: list) -> dict:
+        """Returns a batch of structures as unstored `StructureData` nodes keyed by label
+
+        The structures are built as by the parser, with their sites sorted in the same order.
+        """
+        # pylint: disable=import-outside-toplevel
+        from aiida_supercell.utils.structures import get_structure_node
+        from aiida_supercell.utils.symmetry import analyze_structures
+
+        cifs = self.get_cifs(labels)
+        analyzed = analyze_structures(list(cifs.values()), tier='none')
+        return {label: get_structure_node(*arrays) for label, (arrays, _) in zip(cifs, analyzed)}
+
+
+#EOF
@@ -0,0 +1,70 @@
+"""Bounded in-memory caches and a persistent on-disk store"""
+
+import collections
+import json
+import sqlite3
+
+
+class LRUCache:
+    """Mapping that keeps at most `maxsize` items, evicting the least recently used one first."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Return the value of `key`, marking it as the most recently used, or `default`."""
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value):
+        """Store `value` under `key` and evict the least recently used item if the cache is full."""
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """Remove all items."""
+        self._items.clear()
+
+
+class DiskCache:
+    """Persistent mapping of string keys to JSON-serializable values, stored in an SQLite file
+
+    The file can be shared by several processes. Values are written in a single transaction by `put_many`.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._connection = sqlite3.connect(filename, timeout=60)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._connection.commit()
+
+    def get(self, key: str, default=None):
+        """Return the value of `key`, or `default`."""
+        row = self._connection.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def put_many(self, items: dict):
+        """Store many values at once."""
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)',
+                [(key, json.dumps(value)) for key, value in items.items()],
+            )
+
+    def close(self):
+        """Close the connection to the file."""
+        self._connection.close()
+
+
+#EOF
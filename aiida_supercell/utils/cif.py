@@ -0,0 +1,336 @@
+"""Utilities to read and write CIF files of Supercell"""
+
+import fnmatch
+import math
+import re
+
+import numpy as np
+
+_CELL_PARAMETERS = (
+    '_cell_length_a',
+    '_cell_length_b',
+    '_cell_length_c',
+    '_cell_angle_alpha',
+    '_cell_angle_beta',
+    '_cell_angle_gamma',
+)
+_SYMMETRY_OPERATION_TAGS = ('_symmetry_equiv_pos_as_xyz', '_space_group_symop_operation_xyz')
+_SPACE_GROUP_TAGS = ('_symmetry_space_group_name_h-m', '_space_group_name_h-m_alt')
+_ELEMENT_PATTERN = re.compile(r'[A-Z][a-z]?')
+_NORMALIZE_PATTERN = re.compile(r'[\s\'"]')
+_IDENTITY_PATTERN = re.compile(r'\d*x,y,z')
+_WILDCARD_PATTERN = re.compile(r'\[[^\]]*\]|[*?]')
+_OXIDATION_PATTERN = re.compile(r'[A-Z][a-z]?(\d*\.?\d*)([+-])')
+
+
+class CifLayoutError(ValueError):
+    """Raised when a CIF does not follow the layout of the files written by Supercell."""
+
+
+def _to_float(value: str) -> float:
+    """Converts a CIF number, possibly with its standard uncertainty such as `0.5(2)`, to float."""
+    return float(value.split('(')[0])
+
+
+def lattice_from_parameters(a, b, c, alpha, beta, gamma) -> np.ndarray:
+    """Returns lattice vectors from cell parameters, with the same orientation as pymatgen
+
+    Angles are given in degrees.
+    """
+    alpha_r, beta_r, gamma_r = np.radians([alpha, beta, gamma])
+    val = (math.cos(alpha_r) * math.cos(beta_r) - math.cos(gamma_r)) / (math.sin(alpha_r) * math.sin(beta_r))
+    gamma_star = math.acos(max(-1.0, min(1.0, val)))
+    return np.array([
+        [a * math.sin(beta_r), 0.0, a * math.cos(beta_r)],
+        [
+            -b * math.sin(alpha_r) * math.cos(gamma_star),
+            b * math.sin(alpha_r) * math.sin(gamma_star),
+            b * math.cos(alpha_r),
+        ],
+        [0.0, 0.0, float(c)],
+    ])
+
+
+def _parse_p1_cif(cif_content: str) -> tuple:  # pylint: disable=too-many-branches
+    """Parses a CIF with a single P1 block and fully occupied sites
+
+    Raises:
+        CifLayoutError: if the file contains anything that requires a general CIF parser.
+    """
+    cell = {}
+    header = []
+    rows = []
+    loop_tags = None
+    has_data_block = False
+
+    for line in cif_content.splitlines():
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+
+        if line == 'loop_':
+            loop_tags = []
+            continue
+
+        if line[0] == '_':
+            tag, *value = line.split(None, 1)
+            tag = tag.lower()
+            if loop_tags is not None and not value:
+                loop_tags.append(tag)
+                if tag.startswith('_atom_site_') and not tag.startswith('_atom_site_aniso'):
+                    header = loop_tags
+                continue
+            if not value:
+                raise CifLayoutError(f'tag `{tag}` has no value on the same line')
+            loop_tags = None
+            if tag in _CELL_PARAMETERS:
+                cell[tag] = _to_float(value[0])
+            elif tag in _SPACE_GROUP_TAGS and _NORMALIZE_PATTERN.sub('', value[0]).upper() not in ('P1', '?', ''):
+                raise CifLayoutError('only P1 structures are supported')
+            continue
+
+        if line.startswith('data_'):
+            if has_data_block:
+                raise CifLayoutError('only a single data block is supported')
+            has_data_block = True
+            loop_tags = None
+            continue
+
+        if loop_tags is None or line[0] == ';':
+            raise CifLayoutError(f'unexpected line `{line}`')
+
+        if loop_tags is header:
+            sp = line.split()
+            if len(sp) != len(header):
+                raise CifLayoutError('atom site rows do not match the loop header')
+            rows.append(sp)
+        elif any(tag in _SYMMETRY_OPERATION_TAGS for tag in loop_tags):
+            if not _IDENTITY_PATTERN.fullmatch(_NORMALIZE_PATTERN.sub('', line).lower()):
+                raise CifLayoutError('only the identity symmetry operation is supported')
+
+    if len(cell) != len(_CELL_PARAMETERS) or not rows:
+        raise CifLayoutError('cell parameters or atom sites are missing')
+
+    columns = {tag: i for i, tag in enumerate(header)}
+    try:
+        coords = [columns['_atom_site_fract_x'], columns['_atom_site_fract_y'], columns['_atom_site_fract_z']]
+    except KeyError as exception:
+        raise CifLayoutError('fractional coordinates are missing') from exception
+
+    if '_atom_site_occupancy' in columns:
+        occupancy = columns['_atom_site_occupancy']
+        if any(abs(_to_float(row[occupancy]) - 1.0) > 1e-8 for row in rows):
+            raise CifLayoutError('partially occupied sites are not supported')
+
+    symbol = columns.get('_atom_site_type_symbol', columns.get('_atom_site_label'))
+    if symbol is None:
+        raise CifLayoutError('atom types are missing')
+    species = []
+    for row in rows:
+        match = _ELEMENT_PATTERN.match(row[symbol])
+        if match is None:
+            raise CifLayoutError(f'unknown atom type `{row[symbol]}`')
+        species.append(match.group(0))
+
+    lattice = lattice_from_parameters(*(cell[tag] for tag in _CELL_PARAMETERS))
+    frac_coords = np.array([[_to_float(row[i]) for i in coords] for row in rows])
+    return lattice, species, np.mod(frac_coords, 1.0)
+
+
+def read_supercell_cif(cif_content: str) -> tuple:
+    """Reads a CIF written by Supercell into NumPy arrays
+
+    Supercell writes its structures as P1 CIFs with fully occupied sites, which are parsed
+    directly. Any other file is handed over to the general CIF parser of pymatgen.
+
+    Args:
+        cif_content (str): Content of the CIF file as string.
+    Returns:
+        tuple: Lattice vectors (3x3 array), list of element symbols and fractional coordinates (Nx3 array).
+    """
+    try:
+        return _parse_p1_cif(cif_content)
+    except (ValueError, IndexError):
+        pass
+
+    from pymatgen.core import Structure  # pylint: disable=import-outside-toplevel
+    s_pmg = Structure.from_str(cif_content, fmt='cif')
+    return s_pmg.lattice.matrix, [site.specie.symbol for site in s_pmg], s_pmg.frac_coords
+
+
+def _get_symmetry_operations(data: dict) -> list:
+    """Returns the symmetry operations of a CIF block, from its operations or else from its space group."""
+    # pylint: disable=import-outside-toplevel
+    from pymatgen.core.operations import SymmOp
+    from pymatgen.symmetry.groups import SpaceGroup
+
+    for tag in _SYMMETRY_OPERATION_TAGS:
+        if tag in data:
+            operations = data[tag] if isinstance(data[tag], list) else [data[tag]]
+            return [SymmOp.from_xyz_str(_NORMALIZE_PATTERN.sub('', operation)) for operation in operations]
+    for tag in _SPACE_GROUP_TAGS:
+        if tag in data and _NORMALIZE_PATTERN.sub('', data[tag]) not in ('', '?'):
+            return list(SpaceGroup(data[tag].strip()).symmetry_ops)
+    return [SymmOp.from_xyz_str('x,y,z')]
+
+
+def _parse_oxidation_number(type_symbol: str):
+    """Returns the oxidation number written in an atom type such as `Ca2+`, or None."""
+    match = _OXIDATION_PATTERN.fullmatch(type_symbol)
+    if match is None:
+        return None
+    return float(match.group(1) or 1) * (1 if match.group(2) == '+' else -1)
+
+
+def read_cif_sites(cif_content: str, decimals: int = 4) -> tuple:
+    """Reads the atom sites of a CIF, one per row of its atom site loop, as Supercell does
+
+    Unlike a pymatgen structure, rows sharing a position, e.g. `AlT2` and `SiT2`, are kept apart with
+    their own label. The oxidation number of a row is taken from the atom type loop, or else from its
+    type symbol such as `Ca2+`, and is None when the file does not give one.
+
+    Args:
+        cif_content (str): Content of the CIF file as string.
+        decimals (int): Number of decimals used to identify the positions of an orbit.
+    Returns:
+        tuple: Lattice vectors (3x3 array) and a list with the `label`, `symbol`, `occupancy`, `oxidation_number`
+        and `positions`, the fractional coordinates of the orbit of the site in the unit cell, of each row.
+    """
+    from pymatgen.io.cif import CifFile  # pylint: disable=import-outside-toplevel
+
+    block = next(iter(CifFile.from_str(cif_content).data.values()))
+    data = {tag.lower(): value for tag, value in block.data.items()}
+    lattice = lattice_from_parameters(*(_to_float(data[tag]) for tag in _CELL_PARAMETERS))
+    operations = _get_symmetry_operations(data)
+
+    num_rows = len(data['_atom_site_label']) if isinstance(data['_atom_site_label'], list) else 1
+
+    def loop(tag, default=None):
+        values = data.get(tag, default)
+        return values if isinstance(values, list) else [values] * num_rows
+
+    labels = loop('_atom_site_label')
+    oxidation_numbers = dict(zip(loop('_atom_type_symbol'), loop('_atom_type_oxidation_number')))
+    sites = []
+    for label, type_symbol, occupancy, *coords in zip(
+        labels, loop('_atom_site_type_symbol', ''), loop('_atom_site_occupancy', '1'), loop('_atom_site_fract_x'),
+        loop('_atom_site_fract_y'), loop('_atom_site_fract_z')
+    ):
+        type_symbol = type_symbol if type_symbol not in ('', '.', '?') else label
+        match = _ELEMENT_PATTERN.match(type_symbol)
+        if match is None:
+            raise CifLayoutError(f'unknown atom type `{type_symbol}`')
+        oxidation_number = oxidation_numbers.get(type_symbol)
+        if oxidation_number in (None, '.', '?'):
+            oxidation_number = _parse_oxidation_number(type_symbol)
+        else:
+            oxidation_number = _to_float(oxidation_number)
+
+        position = [_to_float(coord) for coord in coords]
+        images = np.array([operation.operate(position) for operation in operations])
+        # Rounded before wrapping, so that e.g. 0.99999 and 0.0 are the same position, and after, as in 1 - 0.3582
+        images = np.round(np.mod(np.round(images, decimals), 1.0), decimals)
+        sites.append({
+            'label': label,
+            'symbol': match.group(0),
+            'occupancy': _to_float(occupancy) if occupancy not in ('.', '?') else 1.0,
+            'oxidation_number': oxidation_number,
+            'positions': np.unique(images, axis=0),
+        })
+    return lattice, sites
+
+
+def _get_specificity(pattern: str) -> tuple:
+    """Returns whether a pattern has no wildcards and the number of its characters that are not wildcards."""
+    literal = _WILDCARD_PATTERN.sub('', pattern)
+    return literal == pattern, len(literal)
+
+
+def order_charge_patterns(charges: dict) -> list:
+    """Returns the patterns of `charges` from the lowest to the highest precedence
+
+    A site label matched by several patterns gets the charge of the most specific one: a plain label
+    first, then the pattern with the most characters that are not wildcards, e.g. `AlT1` before `Al*1`
+    before `Al*` before `*`. Of patterns as specific as each other, the first in alphabetical order wins.
+    Supercell applies its `-p` options in order, the last match winning, so they are given in this order.
+    """
+    return sorted(sorted(charges, reverse=True), key=_get_specificity)
+
+
+def get_charge(label: str, charges: dict):
+    """Returns the charge of the pattern of `charges` with the highest precedence matching `label`, or None."""
+    for pattern in reversed(order_charge_patterns(charges)):
+        if fnmatch.fnmatchcase(label, pattern):
+            return charges[pattern]
+    return None
+
+
+def write_structure_cif(structure, charges: dict = None) -> str:
+    """Writes a `StructureData` as a P1 CIF, keeping partial occupancies and kind names
+
+    Every symbol of a kind gives one row at the position of its sites, with the weight of the symbol
+    as occupancy. Sites of a kind with a single symbol are labelled with the kind name, sites of a
+    kind with several symbols with the symbol followed by the kind name (e.g. `AlT1` and `SiT1` for
+    the kind `T1`), so that wildcard charges such as `'Al*'` select the expected rows. When `charges`
+    are given, they are written as oxidation numbers of the atom types, matched against the site labels
+    as Supercell does, see `get_charge`.
+
+    Args:
+        structure (orm.StructureData): The structure to write.
+        charges (dict): Formal charges keyed by site label or wildcard.
+    Returns:
+        str: Content of the CIF file.
+    """
+    cell = np.array(structure.cell, dtype=np.float64)
+    lengths = np.linalg.norm(cell, axis=1)
+    angles = [
+        math.degrees(math.acos(np.clip(np.dot(cell[j], cell[k]) / (lengths[j] * lengths[k]), -1.0, 1.0)))
+        for j, k in ((1, 2), (0, 2), (0, 1))
+    ]
+    kinds = {kind.name: kind for kind in structure.kinds}
+
+    rows = []
+    atom_types = {}
+    for site in structure.sites:
+        kind = kinds[site.kind_name]
+        frac = np.linalg.solve(cell.T, np.array(site.position, dtype=np.float64)) + 0.0
+        for symbol, weight in zip(kind.symbols, kind.weights):
+            label = kind.name if len(kind.symbols) == 1 else f'{symbol}{kind.name}'
+            type_symbol = symbol
+            charge = get_charge(label, charges) if charges else None
+            if charge is not None:
+                type_symbol = f'{symbol}{abs(charge):g}{"+" if charge >= 0 else "-"}'
+                atom_types[type_symbol] = charge
+            rows.append(f'  {label}  {type_symbol}  {frac[0]:.8f}  {frac[1]:.8f}  {frac[2]:.8f}  {weight:.6f}')
+
+    lines = [
+        'data_aiida',
+        "_symmetry_space_group_name_H-M   'P 1'",
+        f'_cell_length_a   {lengths[0]:.8f}',
+        f'_cell_length_b   {lengths[1]:.8f}',
+        f'_cell_length_c   {lengths[2]:.8f}',
+        f'_cell_angle_alpha   {angles[0]:.8f}',
+        f'_cell_angle_beta   {angles[1]:.8f}',
+        f'_cell_angle_gamma   {angles[2]:.8f}',
+        '_symmetry_Int_Tables_number   1',
+        'loop_',
+        ' _symmetry_equiv_pos_site_id',
+        ' _symmetry_equiv_pos_as_xyz',
+        "  1  'x, y, z'",
+    ]
+    if atom_types:
+        lines += ['loop_', ' _atom_type_symbol', ' _atom_type_oxidation_number']
+        lines += [f'  {type_symbol}  {charge:g}' for type_symbol, charge in sorted(atom_types.items())]
+    lines += [
+        'loop_',
+        ' _atom_site_label',
+        ' _atom_site_type_symbol',
+        ' _atom_site_fract_x',
+        ' _atom_site_fract_y',
+        ' _atom_site_fract_z',
+        ' _atom_site_occupancy',
+    ]
+    return '\n'.join(lines + rows) + '\n'
+
+
+#EOF
@@ -0,0 +1,152 @@
+"""Estimation of the size of the configuration space before submission"""
+
+import itertools
+import math
+
+import numpy as np
+
+from aiida import orm
+
+from aiida_supercell.utils.cif import get_charge, read_cif_sites, write_structure_cif
+
+
+def _get_pymatgen_structure(structure):
+    """Returns the pymatgen structure of a `StructureData` or of a CIF stored as `SinglefileData`.
+
+    A pymatgen structure is returned as is.
+    """
+    from pymatgen.core import Structure  # pylint: disable=import-outside-toplevel
+    if isinstance(structure, Structure):
+        return structure
+    if isinstance(structure, orm.SinglefileData):
+        with structure.open() as handle:
+            return Structure.from_str(handle.read(), fmt='cif', primitive=False)
+    return structure.get_pymatgen_structure()
+
+
+def _get_cif_sites(structure) -> tuple:
+    """Returns the lattice and the rows of the atom site loop of a structure, see `read_cif_sites`.
+
+    `StructureData` is written as the CIF given to Supercell and pymatgen structures as a P1 CIF.
+    """
+    from pymatgen.core import Structure  # pylint: disable=import-outside-toplevel
+    if isinstance(structure, str):
+        cif_content = structure
+    elif isinstance(structure, orm.SinglefileData):
+        cif_content = structure.get_content()
+    elif isinstance(structure, Structure):
+        from pymatgen.io.cif import CifWriter  # pylint: disable=import-outside-toplevel
+        cif_content = str(CifWriter(structure))
+    else:
+        cif_content = write_structure_cif(structure)
+    return read_cif_sites(cif_content)
+
+
+def _group_sites(lattice, sites: list, tolerance: float) -> list:
+    """Groups the rows whose orbits are closer than `tolerance` to each other with a union-find."""
+    parents = list(range(len(sites)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i, j in itertools.combinations(range(len(sites)), 2):
+        delta = sites[j]['positions'] - sites[i]['positions'][0]
+        delta -= np.round(delta)
+        if np.linalg.norm(np.dot(delta, lattice), axis=1).min() < tolerance:
+            parents[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(sites)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def _multinomial(counts: list) -> int:
+    """Returns the multinomial coefficient (sum(counts))! / prod(count!)."""
+    result = math.factorial(sum(counts))
+    for count in counts:
+        result //= math.factorial(count)
+    return result
+
+
+def estimate_configurations(structure, supercell_size, tolerance=0.75) -> dict:
+    """Estimates the number of configurations Supercell will enumerate
+
+    As in Supercell, every row of the atom site loop of the CIF is a crystallographic orbit, whose
+    positions are found from the symmetry operations of the file. Rows whose orbits are closer than
+    `tolerance`, e.g. `AlT2` and `SiT2` on the same position, form a group. Each group is replicated
+    over the supercell and its occupancies are rounded to integer numbers of atoms, which gives the
+    number of its combinations as a multinomial coefficient. The total is the product over the groups,
+    which is the number Supercell reports as `total_combinations`, before merging symmetrically
+    equivalent configurations, as long as the occupancies are rounded in the same way.
+
+    Args:
+        structure (orm.StructureData or orm.SinglefileData): The input structure of `SupercellCalculation`,
+            the content of a CIF as string, or a pymatgen structure.
+        supercell_size (orm.List or list): Supercell size along the three lattice vectors.
+        tolerance (orm.Float or float): The maximum distance (in Angstroms) between sites of the same group.
+    Returns:
+        dict: Total number of combinations, its decimal logarithm and the details of each group.
+    """
+    supercell_size = supercell_size.get_list() if isinstance(supercell_size, orm.List) else supercell_size
+    tolerance = tolerance.value if isinstance(tolerance, orm.Float) else tolerance
+    multiplier = supercell_size[0] * supercell_size[1] * supercell_size[2]
+
+    lattice, sites = _get_cif_sites(structure)
+    total = 1
+    groups = []
+    for group in _group_sites(lattice, sites, tolerance):
+        num_positions = max(len(sites[i]['positions']) for i in group) * multiplier
+        counts = [round(sites[i]['occupancy'] * len(sites[i]['positions']) * multiplier) for i in group]
+        counts.append(max(0, num_positions - sum(counts)))
+        combinations = _multinomial(counts)
+        total *= combinations
+        if combinations > 1:
+            groups.append({
+                'labels': [sites[i]['label'] for i in group],
+                'occupancies': {sites[i]['label']: sites[i]['occupancy'] for i in group},
+                'positions': num_positions,
+                'combinations': combinations,
+            })
+
+    return {
+        'total_combinations': total,
+        'log10_total_combinations': math.log10(total),
+        'groups': groups,
+    }
+
+
+def get_total_charge(structure, charges=None):
+    """Computes the total charge of the unit cell, weighted by occupancies
+
+    The charge of every row of the atom site loop of the CIF is resolved from its label as Supercell
+    does, see `get_charge`, and rows not matched by any pattern are neutral. Without `charges`, the
+    oxidation numbers of the file are used, unless some rows do not have one.
+
+    Args:
+        structure (orm.StructureData or orm.SinglefileData): The input structure of `SupercellCalculation`,
+            the content of a CIF as string, or a pymatgen structure.
+        charges (orm.Dict or dict): Formal charges keyed by site label or wildcard, as given to
+            `SupercellCalculation`. Defaults to the oxidation numbers of the structure.
+    Returns:
+        float: Total charge of the unit cell, or None if it is unknown since not all oxidation numbers are given.
+    """
+    charges = charges.get_dict() if isinstance(charges, orm.Dict) else charges
+    _, sites = _get_cif_sites(structure)
+
+    total = 0.0
+    for site in sites:
+        if charges is None:
+            charge = site['oxidation_number']
+            if charge is None:
+                return None
+        else:
+            charge = get_charge(site['label'], charges) or 0.0
+        total += charge * site['occupancy'] * len(site['positions'])
+    return total
+
+
+#EOF
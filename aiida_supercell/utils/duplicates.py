@@ -0,0 +1,81 @@
+"""Index of configurations computed by different calculations on the same parent structure
+
+The parser stores the canonical fingerprint of every output structure in the `fingerprints` array of
+`output_structures_info`, and tags this node with the hash of the input structure and the supercell
+size. Configurations already computed by other calculations are then found with a single query on
+these attributes, followed by vectorized comparisons of the fingerprints.
+"""
+
+import numpy as np
+
+from aiida import orm
+
+PARENT_HASH_ATTRIBUTE = 'parent_hash'
+SUPERCELL_SIZE_ATTRIBUTE = 'supercell_size'
+
+
+def tag_structures_info(node: orm.ArrayData, structure: orm.Data, supercell_size: list):
+    """Tags an unstored `output_structures_info` with the index key of its calculation."""
+    node.set_attribute(PARENT_HASH_ATTRIBUTE, structure.get_hash())
+    node.set_attribute(SUPERCELL_SIZE_ATTRIBUTE, [int(size) for size in supercell_size])
+
+
+def find_computed_configurations(structure: orm.Data, supercell_size, fingerprints=None, exclude=None) -> dict:
+    """Finds configurations of a parent structure and supercell size already computed by calculations
+
+    Args:
+        structure (orm.StructureData or orm.SinglefileData): Input structure of the calculations.
+        supercell_size (orm.List or list): Supercell size of the calculations.
+        fingerprints (list): Fingerprints to look for. Defaults to all configurations.
+        exclude (list): PKs of calculations to leave out.
+    Returns:
+        dict: List of (calculation pk, label) tuples for each fingerprint found.
+    """
+    supercell_size = supercell_size.get_list() if isinstance(supercell_size, orm.List) else supercell_size
+    query = orm.QueryBuilder()
+    query.append(orm.CalcJobNode, tag='calculation', project='id')
+    query.append(
+        orm.ArrayData,
+        with_incoming='calculation',
+        edge_filters={'label': 'output_structures_info'},
+        filters={
+            f'attributes.{PARENT_HASH_ATTRIBUTE}': structure.get_hash(),
+            f'attributes.{SUPERCELL_SIZE_ATTRIBUTE}': [int(size) for size in supercell_size],
+        },
+        project='*',
+    )
+
+    wanted = None if fingerprints is None else np.array(list(fingerprints), dtype=str)
+    computed = {}
+    for pk, node in query.iterall():
+        if (exclude and pk in exclude) or 'fingerprints' not in node.get_arraynames():
+            continue
+        found = node.get_array('fingerprints')
+        labels = node.get_array('labels')
+        mask = np.ones(len(found), dtype=bool) if wanted is None else np.isin(found, wanted)
+        for fingerprint, label in zip(found[mask].tolist(), labels[mask].tolist()):
+            computed.setdefault(fingerprint, []).append((pk, label))
+    return computed
+
+
+def find_duplicates(calculation: orm.CalcJobNode) -> dict:
+    """Returns the output structures of a `SupercellCalculation` already computed by other calculations
+
+    Returns:
+        dict: List of (calculation pk, label) tuples of the other calculations for each label of `calculation`.
+    """
+    info = calculation.outputs.output_structures_info
+    computed = find_computed_configurations(
+        calculation.inputs.structure,
+        calculation.inputs.supercell_size,
+        info.get_array('fingerprints').tolist(),
+        exclude=[calculation.pk],
+    )
+    return {
+        label: computed[fingerprint]
+        for label, fingerprint in zip(info.get_array('labels').tolist(), info.get_array('fingerprints').tolist())
+        if fingerprint in computed
+    }
+
+
+#EOF
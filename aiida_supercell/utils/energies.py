@@ -0,0 +1,208 @@
+"""Utilities to read Coulomb energy files written by Supercell"""
+
+import heapq
+import itertools
+import math
+import warnings
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from aiida import orm
+
+
+_ENERGY_LINE_DTYPE = np.dtype([('name', 'S256'), ('energy', np.float64)])
+
+
+def _parse_energy_lines(lines: list) -> tuple:
+    """Parses raw lines of a Coulomb energy file with NumPy
+
+    Names such as `aiida_supercell_i01_w4.cif` are split into label and degeneracy with vectorized
+    string operations, as `parse_structure_name` does for a single name.
+    """
+    with warnings.catch_warnings():
+        # A chunk of blank lines is a valid empty table
+        warnings.simplefilter('ignore', UserWarning)
+        table = np.loadtxt(lines, dtype=_ENERGY_LINE_DTYPE, usecols=(0, 1), comments=None, ndmin=1)
+
+    if table.size == 0:
+        return np.array([], dtype=np.bytes_), table['energy'], np.array([], dtype=np.int32)
+
+    # String operations scale with the width of the array, so names are narrowed to the longest one first
+    names = table['name'].astype(f'S{max(1, int(np.char.str_len(table["name"]).max()))}')
+    names = np.char.rpartition(names, b'/')[:, 2]
+    labels = np.char.partition(np.char.partition(np.char.partition(names, b'_')[:, 2], b'_')[:, 2], b'_')[:, 0]
+    degeneracies = np.char.lstrip(np.char.partition(np.char.rpartition(names, b'_')[:, 2], b'.')[:, 0], b'w')
+    labels = labels.astype(f'S{max(1, int(np.char.str_len(labels).max()))}')
+    return labels, table['energy'], degeneracies.astype(np.int32)
+
+
+def iterate_energy_chunks(lines: Iterable[str], chunk_size: int = 65536) -> Iterator[tuple]:
+    """Reads a Supercell Coulomb energy file in chunks of compact NumPy arrays
+
+    At most `chunk_size` raw lines are read at once and parsed by NumPy, so memory is bounded by the
+    chunk size whatever the size of the energy files.
+
+    Args:
+        lines (iterable): Lines of an `aiida_supercell_coulomb_energy_*.txt` file, e.g. an open file handle.
+        chunk_size (int): Maximum number of lines per chunk.
+    Yields:
+        tuple: Arrays of labels (fixed-width bytes), Coulomb energies in eV (float64) and degeneracies (int32).
+    """
+    lines = iter(lines)
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        labels, energies, degeneracies = _parse_energy_lines(chunk)
+        if labels.size:
+            yield labels, energies, degeneracies
+
+
+def iterate_energies(lines: Iterable[str]) -> Iterator[tuple]:
+    """Reads a Supercell Coulomb energy file record by record
+
+    Args:
+        lines (iterable): Lines of an `aiida_supercell_coulomb_energy_*.txt` file, e.g. an open file handle.
+    Yields:
+        tuple: Label (str), Coulomb energy in eV (float) and degeneracy (int) of each structure.
+    """
+    for labels, energies, degeneracies in iterate_energy_chunks(lines):
+        yield from zip(np.char.decode(labels).tolist(), energies.tolist(), degeneracies.tolist())
+
+
+def load_energies(chunks: Iterable[tuple]) -> tuple:
+    """Loads chunks of Coulomb energies into NumPy arrays
+
+    The only copy of the whole table is the final one. Labels are kept as fixed-width bytes, which take
+    a quarter of the size of unicode strings.
+
+    Args:
+        chunks (iterable): Chunks as yielded by `iterate_energy_chunks`, e.g. chained over all energy files
+            of a calculation.
+    Returns:
+        tuple: Arrays of labels (fixed-width bytes), Coulomb energies in eV (float64) and degeneracies (int32).
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return np.array([], dtype=np.bytes_), np.array([], dtype=np.float64), np.array([], dtype=np.int32)
+    return tuple(np.concatenate(column) for column in zip(*chunks))
+
+
+def histogram_energies(chunks: Iterable[tuple], min_energy: float, max_energy: float, bins: int = 10) -> dict:
+    """Computes the degeneracy-weighted histogram of chunks of Coulomb energies
+
+    The bins are the same as those of `summarize_energies` for the same energies, given their minimum and
+    maximum, e.g. from the summary of `select_energies`.
+    """
+    counts = np.zeros(bins, dtype=np.int64)
+    bin_edges = None
+    for _, energies, degeneracies in chunks:
+        chunk_counts, bin_edges = np.histogram(
+            energies, bins=bins, range=(min_energy, max_energy), weights=degeneracies
+        )
+        counts += chunk_counts.astype(np.int64)
+    if bin_edges is None:
+        return {}
+    return {
+        'bin_edges': bin_edges.tolist(),
+        'weighted_counts': counts.tolist(),
+    }
+
+
+def select_energies(chunks: Iterable[tuple], size: int, mode: str = 'low_energy') -> tuple:
+    """Selects the structures with the lowest or highest Coulomb energies from chunks of energies
+
+    Only a bounded heap of `size` records is kept in memory, whatever the number of records. Each
+    chunk is first narrowed down with NumPy to its own best `size` records, ties included, so that
+    only those go through the heap.
+
+    Args:
+        chunks (iterable): Chunks as yielded by `iterate_energy_chunks`.
+        size (int): Number of structures to be selected.
+        mode (str): Either `low_energy` or `high_energy`. Defaults to `low_energy`.
+    Returns:
+        tuple: Arrays of labels, energies and degeneracies of the selected structures, sorted from
+            the best to the worst, and a dictionary of summary statistics over all records.
+    """
+    if mode not in ('low_energy', 'high_energy'):
+        raise ValueError(f'Unknown selection mode `{mode}`, use `low_energy` or `high_energy`.')
+    sign = 1.0 if mode == 'low_energy' else -1.0
+
+    # The root of the heap is the worst of the structures kept so far
+    heap = []
+    kept = set()
+    count = 0
+    total = 0.0
+    min_energy = math.inf
+    max_energy = -math.inf
+
+    for labels, energies, degeneracies in chunks:
+        count += energies.size
+        total += float(energies.sum())
+        min_energy = min(min_energy, float(energies.min()))
+        max_energy = max(max_energy, float(energies.max()))
+
+        keys = sign * energies
+        if size < keys.size:
+            candidates = np.flatnonzero(keys <= np.partition(keys, size - 1)[size - 1])
+        else:
+            candidates = np.arange(keys.size)
+        for i in candidates[np.argsort(keys[candidates], kind='stable')].tolist():
+            label = labels[i]
+            if label in kept:
+                continue
+            entry = (float(-keys[i]), label, int(degeneracies[i]))
+            if len(heap) < size:
+                heapq.heappush(heap, entry)
+                kept.add(label)
+            elif heap and entry > heap[0]:
+                kept.discard(heapq.heapreplace(heap, entry)[1])
+                kept.add(label)
+
+    selected = sorted(heap, reverse=True)
+    labels = np.array([entry[1] for entry in selected], dtype=np.bytes_)
+    energies = np.array([-sign * entry[0] for entry in selected], dtype=np.float64)
+    degeneracies = np.array([entry[2] for entry in selected], dtype=np.int32)
+
+    summary = {'number_of_structures': count}
+    if count:
+        summary.update({'min': min_energy, 'max': max_energy, 'mean': total / count})
+    return labels, energies, degeneracies, summary
+
+
+def get_energy_table(labels: np.ndarray, energies: np.ndarray, degeneracies: np.ndarray) -> orm.ArrayData:
+    """Stores the Coulomb energy table as an unstored `ArrayData`."""
+    node = orm.ArrayData()
+    node.set_array('labels', labels)
+    node.set_array('energies', energies)
+    node.set_array('degeneracies', degeneracies)
+    return node
+
+
+def summarize_energies(energies: np.ndarray, degeneracies: np.ndarray, bins: int = 10) -> dict:
+    """Computes summary statistics of Coulomb energies
+
+    Args:
+        energies (np.ndarray): Coulomb energies in eV.
+        degeneracies (np.ndarray): Degeneracy of each configuration, used as weights of the histogram.
+        bins (int): Number of bins of the histogram. Defaults to 10.
+    Returns:
+        dict: Minimum, maximum and mean energies and the degeneracy-weighted histogram.
+    """
+    if energies.size == 0:
+        return {'number_of_structures': 0}
+    counts, bin_edges = np.histogram(energies, bins=bins, weights=degeneracies)
+    return {
+        'number_of_structures': int(energies.size),
+        'min': float(energies.min()),
+        'max': float(energies.max()),
+        'mean': float(energies.mean()),
+        'histogram': {
+            'bin_edges': bin_edges.tolist(),
+            'weighted_counts': counts.astype(np.int64).tolist(),
+        },
+    }
+
+
+#EOF
@@ -0,0 +1,43 @@
+"""Canonical fingerprints of structures generated by Supercell"""
+
+import hashlib
+
+import numpy as np
+
+
+def get_fingerprint(lattice, species, frac_coords, decimals: int = 4) -> str:
+    """Returns a canonical fingerprint of a structure in its supercell frame
+
+    Configurations generated by Supercell share the lattice of the supercell, hence two of them
+    are identical if they have the same species at the same fractional coordinates, regardless of
+    the order of the sites. Coordinates are rounded and wrapped into the unit cell before sorting.
+
+    Args:
+        lattice: Lattice vectors as 3x3 array.
+        species: Element symbol of each site.
+        frac_coords: Fractional coordinates as Nx3 array.
+        decimals (int): Number of decimals kept for coordinates and lattice. Defaults to 4.
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    # Adding zero turns negative zeros, which have different bytes, into positive ones
+    frac_coords = np.mod(np.round(np.asarray(frac_coords, dtype=np.float64), decimals), 1.0) + 0.0
+    order = np.lexsort((frac_coords[:, 2], frac_coords[:, 1], frac_coords[:, 0], np.asarray(species)))
+
+    digest = hashlib.sha256()
+    digest.update((np.round(np.asarray(lattice, dtype=np.float64), decimals) + 0.0).tobytes())
+    digest.update(' '.join(np.asarray(species)[order]).encode('utf-8'))
+    digest.update(frac_coords[order].tobytes())
+    return digest.hexdigest()
+
+
+def get_structure_fingerprint(structure) -> str:
+    """Returns the canonical fingerprint of a `StructureData`, see `get_fingerprint`."""
+    lattice = np.array(structure.cell)
+    kinds = {kind.name: kind.symbol for kind in structure.kinds}
+    species = [kinds[site.kind_name] for site in structure.sites]
+    positions = np.array([site.position for site in structure.sites])
+    return get_fingerprint(lattice, species, np.linalg.solve(lattice.T, positions.T).T)
+
+
+#EOF
@@ -0,0 +1,188 @@
+"""Merging of symmetrically equivalent configurations given as occupation vectors
+
+A symmetry operation of the supercell maps its positions onto each other, i.e. it is a permutation
+of the columns of the occupation vectors. Two configurations are equivalent if one of these
+permutations turns one into the other. Permutations are computed once, after which every
+configuration is mapped to a canonical representative of its orbit with NumPy array operations.
+"""
+
+import numpy as np
+
+from aiida import orm
+
+from aiida_supercell.utils.occupations import get_template
+
+
+def get_site_permutations(template: tuple, types, symprec: float = 0.01) -> np.ndarray:
+    """Computes the permutations of the template positions by the symmetry operations of the supercell
+
+    Args:
+        template (tuple): Lattice, positions and alphabet as returned by `build_template`.
+        types: Type of each position, from the sites of the parent structure, as returned by `build_template`.
+            Types must not be inferred from the configurations: a position with the same species, or vacant,
+            in all of them would not be mapped onto its equivalent positions.
+        symprec (float): Distance tolerance in Angstroms.
+    Returns:
+        np.ndarray: One row per symmetry operation, giving the position each position is mapped onto.
+    """
+    import spglib  # pylint: disable=import-outside-toplevel
+
+    lattice, positions, _ = template
+    lattice = np.asarray(lattice, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+    symmetry = spglib.get_symmetry((lattice, positions, np.asarray(types)), symprec=symprec)
+
+    permutations = []
+    for rotation, translation in zip(symmetry['rotations'], symmetry['translations']):
+        images = np.dot(positions, np.asarray(rotation).T) + translation
+        delta = images[:, np.newaxis, :] - positions[np.newaxis, :, :]
+        delta -= np.round(delta)
+        distances = np.linalg.norm(np.dot(delta, lattice), axis=2)
+        permutation = distances.argmin(axis=1)
+        if distances[np.arange(len(positions)), permutation].max() < symprec:
+            permutations.append(permutation)
+    return np.array(permutations, dtype=np.int64).reshape(-1, len(positions))
+
+
+def canonicalize(occupations: np.ndarray, permutations: np.ndarray, max_memory: int = 2**28) -> np.ndarray:
+    """Maps each occupation vector to the smallest of its images under the permutations
+
+    Vectors are compared as raw bytes, which gives a total order: equivalent configurations get
+    the same canonical vector. Configurations are processed in batches whose images, one per
+    configuration and permutation, take at most about `max_memory` bytes.
+
+    Returns:
+        np.ndarray: Canonical occupation vectors, in the same order as `occupations`.
+    """
+    occupations = np.ascontiguousarray(occupations)
+    row = np.dtype((np.void, occupations.dtype.itemsize * occupations.shape[1]))
+    # The images are sorted, which takes a copy of them
+    batch_size = max(1, max_memory // (2 * max(1, len(permutations) * row.itemsize)))
+    canonical = np.empty_like(occupations)
+    for start in range(0, len(occupations), batch_size):
+        images = np.ascontiguousarray(occupations[start:start + batch_size][:, permutations])
+        smallest = np.sort(images.view(row)[..., 0], axis=1)[:, 0]
+        canonical[start:start + batch_size] = np.ascontiguousarray(smallest).view(occupations.dtype).reshape(
+            -1, occupations.shape[1]
+        )
+    return canonical
+
+
+def merge_configurations(
+    occupations: np.ndarray, degeneracies, permutations: np.ndarray, max_memory: int = 2**28
+) -> dict:
+    """Merges symmetrically equivalent configurations and sums their degeneracies
+
+    Returns:
+        dict: `representatives`, the index of the first configuration of each distinct orbit,
+        `occupations`, their canonical vectors, `degeneracies`, the summed degeneracies, and
+        `inverse`, the index of the orbit of each input configuration.
+    """
+    canonical = canonicalize(occupations, permutations, max_memory)
+    row = np.dtype((np.void, canonical.dtype.itemsize * canonical.shape[1]))
+    _, representatives, inverse = np.unique(
+        np.ascontiguousarray(canonical).view(row)[:, 0], return_index=True, return_inverse=True
+    )
+    inverse = inverse.reshape(-1)
+    order = np.argsort(representatives, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return {
+        'representatives': representatives[order],
+        'occupations': canonical[representatives[order]],
+        'degeneracies': np.bincount(rank[inverse], weights=np.asarray(degeneracies), minlength=len(order)).astype(
+            np.int64
+        ),
+        'inverse': rank[inverse],
+    }
+
+
+def _get_permutations(node: orm.ArrayData, num_operations: int, symprec: float) -> np.ndarray:
+    """Returns the distinct permutations of the template of a table, checked against the number of operations."""
+    permutations = get_site_permutations(get_template(node), node.get_array('site_types'), symprec)
+    if len(permutations) != num_operations:
+        raise ValueError(f'found {len(permutations)} symmetry operations instead of {num_operations}')
+    # Operations acting in the same way on all positions, e.g. in small supercells, only need to be applied once
+    return np.unique(permutations, axis=0)
+
+
+def merge_occupation_table(node: orm.ArrayData, degeneracies, num_operations: int, symprec: float = 0.01) -> dict:
+    """Merges the configurations of an `output_occupations` table
+
+    The symmetry operations are those of the parent structure in the supercell, found from the positions
+    and `site_types` of the template, and must match the number reported by Supercell.
+
+    Args:
+        node (orm.ArrayData): Table built by `get_occupation_table`, e.g. the `output_occupations` of a calculation.
+        degeneracies: Degeneracy of each configuration, e.g. from `output_structures_info`.
+        num_operations (int): Number of symmetry operations of the supercell, `Number_of_symmetry_operations`
+            of `output_parameters`.
+        symprec (float): Distance tolerance in Angstroms.
+    Returns:
+        dict: As returned by `merge_configurations`, with the `labels` of the representatives.
+    Raises:
+        ValueError: if the number of symmetry operations found differs from `num_operations`.
+    """
+    permutations = _get_permutations(node, num_operations, symprec)
+    merged = merge_configurations(node.get_array('occupations'), degeneracies, permutations)
+    merged['labels'] = node.get_array('labels')[merged['representatives']]
+    return merged
+
+
+def merge_occupation_tables(nodes: list, degeneracies: list, num_operations: int, symprec: float = 0.01) -> dict:
+    """Merges the configurations of the `output_occupations` tables of several calculations
+
+    The calculations must share the input structure and the supercell size, hence the template, e.g.
+    the calculations found by `find_computed_configurations`. Equivalent configurations of each table
+    are merged and their degeneracies summed, as by `merge_occupation_table`. Configurations found by
+    several calculations are then kept once, with the largest of their degeneracies, since each
+    calculation counts the same orbit.
+
+    Args:
+        nodes (list): Tables built by `get_occupation_table`.
+        degeneracies (list): Degeneracies of the configurations of each table.
+        num_operations (int): Number of symmetry operations of the supercell.
+        symprec (float): Distance tolerance in Angstroms.
+    Returns:
+        dict: `labels`, `occupations` and `degeneracies` of the distinct configurations and `sources`,
+        the index of the table each of them was first found in.
+    Raises:
+        ValueError: if the tables do not share the same template, or if the number of symmetry operations
+            found differs from `num_operations`.
+    """
+    reference = nodes[0]
+    for node in nodes[1:]:
+        for name in ('positions', 'alphabet', 'site_types'):
+            if not np.array_equal(node.get_array(name), reference.get_array(name)):
+                raise ValueError(f'tables do not share the same template: `{name}` differs')
+        if not np.allclose(node.get_array('lattice'), reference.get_array('lattice')):
+            raise ValueError('tables do not share the same template: `lattice` differs')
+
+    permutations = _get_permutations(reference, num_operations, symprec)
+    tables = [
+        merge_configurations(node.get_array('occupations'), node_degeneracies, permutations)
+        for node, node_degeneracies in zip(nodes, degeneracies)
+    ]
+    # Canonical vectors are comparable across tables, so identical rows are the same orbit
+    canonical = np.ascontiguousarray(np.concatenate([table['occupations'] for table in tables]))
+    row = np.dtype((np.void, canonical.dtype.itemsize * canonical.shape[1]))
+    _, first, inverse = np.unique(canonical.view(row)[:, 0], return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    merged_degeneracies = np.zeros(len(order), dtype=np.int64)
+    np.maximum.at(merged_degeneracies, rank[inverse], np.concatenate([table['degeneracies'] for table in tables]))
+    labels = np.concatenate([
+        node.get_array('labels')[table['representatives']] for node, table in zip(nodes, tables)
+    ])
+    sources = np.concatenate([np.full(len(table['representatives']), i) for i, table in enumerate(tables)])
+    return {
+        'labels': labels[first[order]],
+        'occupations': canonical[first[order]],
+        'degeneracies': merged_degeneracies,
+        'sources': sources[first[order]],
+    }
+
+#EOF
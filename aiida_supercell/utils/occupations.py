@@ -0,0 +1,141 @@
+"""Occupation-vector representation of configurations generated by Supercell
+
+All configurations of a calculation share the lattice and the positions of the supercell and only
+differ by which species sits on each position. They are encoded against a template, the positions of
+the parent structure repeated over the supercell, as one small integer per position: the index of the
+species in an alphabet whose first entry, the empty string, stands for a vacancy. Configurations of
+different calculations on the same parent structure and supercell size share the same template.
+"""
+
+import itertools
+
+import numpy as np
+
+from aiida import orm
+
+from aiida_supercell.utils.cif import lattice_from_parameters
+
+VACANCY = ''
+
+
+def _position_keys(frac_coords, decimals: int) -> np.ndarray:
+    """Maps fractional coordinates, wrapped into the unit cell and rounded, to single integer keys."""
+    scale = 10**decimals
+    grid = np.mod(np.round(np.asarray(frac_coords, dtype=np.float64).reshape(-1, 3) * scale), scale).astype(np.int64)
+    return (grid[:, 0] * scale + grid[:, 1]) * scale + grid[:, 2]
+
+
+def build_template(structure, supercell_size, decimals: int = 4) -> tuple:
+    """Builds the template of the configurations of a parent structure in a supercell
+
+    Every site of the parent structure is repeated over the supercell, whether or not it is occupied
+    in a given configuration, and its position is identified up to `decimals` decimals. The lattice
+    is built from the cell parameters, as in the CIFs written by Supercell.
+
+    Args:
+        structure (orm.StructureData or orm.SinglefileData): The input structure of `SupercellCalculation`,
+            or a pymatgen structure.
+        supercell_size (orm.List or list): Supercell size along the three lattice vectors.
+        decimals (int): Number of decimals used to identify positions. Defaults to 4.
+    Returns:
+        tuple: Template, i.e. lattice, fractional coordinates of the positions (Mx3 array) and alphabet of
+        species, and type of each position: positions of parent sites with the same species and occupancies
+        have the same type.
+    """
+    from aiida_supercell.utils.configurations import _get_pymatgen_structure  # pylint: disable=import-outside-toplevel
+
+    supercell_size = supercell_size.get_list() if isinstance(supercell_size, orm.List) else list(supercell_size)
+    s_pmg = _get_pymatgen_structure(structure)
+    abc = np.array(s_pmg.lattice.abc) * supercell_size
+    lattice = lattice_from_parameters(*abc, *s_pmg.lattice.angles)
+
+    compositions = [tuple(sorted((species.symbol, occupancy) for species, occupancy in site.species.items()))
+                    for site in s_pmg]
+    kinds = {composition: i for i, composition in enumerate(sorted(set(compositions)))}
+    shifts = np.array(list(itertools.product(*(range(size) for size in supercell_size))), dtype=np.float64)
+    positions = (s_pmg.frac_coords[:, np.newaxis, :] + shifts[np.newaxis, :, :]) / supercell_size
+    types = np.repeat([kinds[composition] for composition in compositions], len(shifts))
+
+    positions = positions.reshape(-1, 3)
+    _, first = np.unique(_position_keys(positions, decimals), return_index=True)
+    alphabet = [VACANCY] + sorted({symbol for composition in kinds for symbol, _ in composition})
+    # Wrapped consistently with the rounded keys, e.g. 0.99999 becomes -0.00001 rather than staying close to 1
+    positions = positions[first]
+    return (lattice, positions - np.floor(np.round(positions, decimals)), alphabet), types[first].astype(np.int64)
+
+
+def encode_configurations(template: tuple, structures: list, decimals: int = 4) -> np.ndarray:
+    """Encodes configurations as occupation vectors against a template
+
+    Args:
+        template (tuple): Lattice, template positions and alphabet as returned by `build_template`.
+        structures (list): Tuples of lattice, species and fractional coordinates of each configuration.
+        decimals (int): Number of decimals used to identify positions, as for the template.
+    Returns:
+        np.ndarray: One row per configuration and one column per template position, holding the index
+        of the species in the alphabet. Positions not found in a configuration are vacant.
+    Raises:
+        ValueError: if a configuration has positions or species that are not part of the template.
+    """
+    _, positions, alphabet = template
+    keys = _position_keys(positions, decimals)
+    order = np.argsort(keys)
+    symbols = np.array(alphabet[1:], dtype=str)
+
+    occupations = np.zeros((len(structures), len(positions)), dtype=np.uint8 if len(alphabet) <= 256 else np.uint16)
+    for row, (_, species, frac_coords) in zip(occupations, structures):
+        found = np.searchsorted(keys, _position_keys(frac_coords, decimals), sorter=order)
+        columns = order[np.minimum(found, len(order) - 1)]
+        if not np.array_equal(keys[columns], _position_keys(frac_coords, decimals)):
+            raise ValueError('configuration has positions that are not part of the template')
+        species = np.asarray(species, dtype=str)
+        if not np.isin(species, symbols).all():
+            raise ValueError('configuration has species that are not part of the template')
+        row[columns] = np.searchsorted(symbols, species) + 1
+    return occupations
+
+
+def decode_configurations(template: tuple, occupations: np.ndarray) -> list:
+    """Decodes occupation vectors back to configurations
+
+    Returns:
+        list: Tuples of lattice, species and fractional coordinates of the occupied sites of each configuration.
+    """
+    lattice, positions, alphabet = template
+    species = np.array(alphabet, dtype=object)[np.atleast_2d(occupations)]
+    occupied = np.atleast_2d(occupations) > 0
+    return [(lattice, row[mask].tolist(), positions[mask]) for row, mask in zip(species, occupied)]
+
+
+def get_occupation_table(  # pylint: disable=too-many-arguments
+    labels: list, structures: list, template: tuple, site_types, decimals: int = 4
+) -> orm.ArrayData:
+    """Encodes configurations into an unstored `ArrayData`
+
+    Args:
+        labels (list): Label of each configuration.
+        structures (list): Tuples of lattice, species and fractional coordinates of each configuration.
+        template (tuple): Template as returned by `build_template`.
+        site_types: Type of each position of the template, as returned by `build_template`.
+        decimals (int): Number of decimals used to identify positions, as for the template.
+    Returns:
+        orm.ArrayData: Arrays `labels`, `occupations`, `lattice`, `positions`, `alphabet` and `site_types`.
+    Raises:
+        ValueError: if a configuration has positions that are not part of the template.
+    """
+    node = orm.ArrayData()
+    node.set_array('labels', np.array(labels, dtype=str))
+    node.set_array('occupations', encode_configurations(template, structures, decimals))
+    node.set_array('lattice', template[0])
+    node.set_array('positions', template[1])
+    node.set_array('alphabet', np.array(template[2], dtype=str))
+    node.set_array('site_types', np.asarray(site_types, dtype=np.int64))
+    return node
+
+
+def get_template(node: orm.ArrayData) -> tuple:
+    """Returns the template of a table built by `get_occupation_table`."""
+    return node.get_array('lattice'), node.get_array('positions'), node.get_array('alphabet').tolist()
+
+
+#EOF
@@ -0,0 +1,81 @@
+"""Sampling of structures from a stream of records, with the modes of `sample_structures`"""
+
+import collections
+import heapq
+import random
+
+SAMPLING_MODES = ('low_energy', 'high_energy', 'random', 'first', 'last', 'degeneracy')
+ENERGY_MODES = ('low_energy', 'high_energy')
+
+
+def sample_records(records, sample_structures: dict, random_seed: int = 0) -> dict:
+    """Samples structures from a stream of records in a single pass
+
+    The modes are those of the `sample_structures` input of `SupercellCalculation`: the structures
+    with the lowest or highest energies, a uniform random sample, the first or last ones in the order
+    of the records and, as Supercell does, all structures whose degeneracy is smaller than or equal to
+    the value of `degeneracy`. The random sample uses reservoir sampling, so apart from `degeneracy`,
+    each mode keeps at most as many records as it samples.
+
+    Args:
+        records (iterable): Tuples of label, energy (None if unknown) and degeneracy of each structure.
+        sample_structures (dict): Number of structures to sample for each mode, or maximum degeneracy
+            for `degeneracy`.
+        random_seed (int): Seed of the `random` mode.
+    Returns:
+        dict: Sampled records for each mode, in order of the records for `first`, `last` and `degeneracy`,
+        by energy for `low_energy` and `high_energy`.
+    Raises:
+        ValueError: if a mode is unknown, or if energies are required but missing.
+    """
+    unknown = set(sample_structures) - set(SAMPLING_MODES)
+    if unknown:
+        raise ValueError(f'unknown sampling modes: {", ".join(sorted(unknown))}')
+
+    size = {mode: int(sample_structures.get(mode, 0)) for mode in SAMPLING_MODES}
+    rng = random.Random(random_seed)
+    low, high, uniform, low_degeneracy, first = [], [], [], [], []
+    last = collections.deque(maxlen=size['last'])
+
+    for i, record in enumerate(records):
+        label, energy, degeneracy = record
+        if energy is None and (size['low_energy'] or size['high_energy']):
+            raise ValueError(f'no energy for structure `{label}`, energy modes cannot be used')
+        if size['low_energy']:
+            _push(low, (-energy, -i, record), size['low_energy'])
+        if size['high_energy']:
+            _push(high, (energy, -i, record), size['high_energy'])
+        if size['random']:
+            if len(uniform) < size['random']:
+                uniform.append((i, record))
+            else:
+                j = rng.randint(0, i)
+                if j < size['random']:
+                    uniform[j] = (i, record)
+        if size['degeneracy'] and degeneracy <= size['degeneracy']:
+            low_degeneracy.append(record)
+        if len(first) < size['first']:
+            first.append(record)
+        if size['last']:
+            last.append(record)
+
+    sampled = {
+        'low_energy': [record for _, _, record in sorted(low, reverse=True)],
+        'high_energy': [record for _, _, record in sorted(high, reverse=True)],
+        'random': [record for _, record in sorted(uniform)],
+        'degeneracy': low_degeneracy,
+        'first': first,
+        'last': list(last),
+    }
+    return {mode: sampled[mode] for mode in SAMPLING_MODES if size[mode]}
+
+
+def _push(heap: list, item: tuple, size: int):
+    """Keeps the `size` largest items of a stream in a min-heap."""
+    if len(heap) < size:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+#EOF
@@ -0,0 +1,123 @@
+"""Creation and storage of many `StructureData` nodes"""
+
+import numpy as np
+
+from aiida import orm
+from aiida.orm.nodes.data.structure import Kind
+
+
+def get_structure_node(lattice, species, frac_coords) -> orm.StructureData:
+    """Builds a periodic `StructureData` of fully occupied sites directly from arrays
+
+    Kinds are named after their element, in order of first appearance, as when converting
+    from pymatgen, without building any intermediate `Site` or pymatgen object.
+
+    Args:
+        lattice: Lattice vectors as 3x3 array.
+        species: Element symbol of each site.
+        frac_coords: Fractional coordinates as Nx3 array.
+    Returns:
+        orm.StructureData: The unstored structure.
+    """
+    lattice = np.asarray(lattice, dtype=np.float64)
+    positions = np.dot(np.asarray(frac_coords, dtype=np.float64), lattice)
+
+    structure = orm.StructureData(cell=lattice.tolist())
+    structure.set_attribute('kinds', [Kind(symbols=symbol, name=symbol).get_raw() for symbol in dict.fromkeys(species)])
+    structure.set_attribute(
+        'sites', [{
+            'position': tuple(position),
+            'kind_name': symbol
+        } for symbol, position in zip(species, positions.tolist())]
+    )
+    return structure
+
+
+def get_structures_info(  # pylint: disable=too-many-arguments
+    labels: list,
+    degeneracies: list,
+    symmetry_infos: list,
+    coulomb_energies=None,
+    fingerprints: list = None,
+) -> orm.ArrayData:
+    """Stores per-structure information as one array per field in an unstored `ArrayData`
+
+    Args:
+        labels (list): Label of each structure.
+        degeneracies (list): Degeneracy of each structure.
+        symmetry_infos (list): Dictionary with the `crystal_system`, `lattice_type` and `space_group_symbol`
+            of each structure.
+        coulomb_energies: Coulomb energy of each structure in eV, NaN where unknown. Left out if not given.
+        fingerprints (list): Canonical fingerprint of each structure. Left out if not given.
+    Returns:
+        orm.ArrayData: Arrays `labels`, `degeneracies`, `crystal_systems`, `lattice_types`,
+        `space_group_symbols` and, optionally, `coulomb_energies` and `fingerprints`.
+    """
+    node = orm.ArrayData()
+    node.set_array('labels', np.array(labels, dtype=str))
+    node.set_array('degeneracies', np.array(degeneracies, dtype=np.int64))
+    for field in ('crystal_system', 'lattice_type', 'space_group_symbol'):
+        node.set_array(f'{field}s', np.array([info.get(field, '') for info in symmetry_infos], dtype=str))
+    if coulomb_energies is not None:
+        node.set_array('coulomb_energies', np.asarray(coulomb_energies, dtype=np.float64))
+    if fingerprints is not None:
+        node.set_array('fingerprints', np.array(fingerprints, dtype=str))
+    return node
+
+
+def get_structure_info(node: orm.ArrayData, label: str) -> dict:
+    """Returns the information of a single structure from a node built by `get_structures_info`."""
+    positions = np.flatnonzero(node.get_array('labels') == label)
+    if positions.size == 0:
+        raise KeyError(f'no structure with label `{label}`')
+    i = positions[0]
+    info = {'degeneracy': int(node.get_array('degeneracies')[i])}
+    for field in ('crystal_system', 'lattice_type', 'space_group_symbol'):
+        info[field] = str(node.get_array(f'{field}s')[i])
+    if 'coulomb_energies' in node.get_arraynames():
+        info['coulombic_energy'] = float(node.get_array('coulomb_energies')[i])
+    return info
+
+
+def get_structure_table(labels: list, structures: list) -> orm.ArrayData:
+    """Stacks many structures into a single unstored `ArrayData`
+
+    Structures may have different numbers of sites: species and coordinates of all structures are
+    concatenated and `offsets` gives where each structure starts and ends.
+
+    Args:
+        labels (list): Label of each structure.
+        structures (list): Tuples of lattice, species and fractional coordinates of each structure.
+    Returns:
+        orm.ArrayData: Arrays `labels`, `lattices`, `offsets`, `species` and `frac_coords`.
+    """
+    sizes = [len(species) for _, species, _ in structures]
+    node = orm.ArrayData()
+    node.set_array('labels', np.array(labels, dtype=str))
+    node.set_array('lattices', np.array([lattice for lattice, _, _ in structures], dtype=np.float64).reshape(-1, 3, 3))
+    node.set_array('offsets', np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]).astype(np.int64))
+    node.set_array('species', np.array([symbol for _, species, _ in structures for symbol in species], dtype=str))
+    node.set_array(
+        'frac_coords',
+        np.concatenate([np.asarray(frac_coords, dtype=np.float64).reshape(-1, 3) for _, _, frac_coords in structures])
+        if structures else np.zeros((0, 3))
+    )
+    return node
+
+
+def get_structure_from_table(node: orm.ArrayData, label: str) -> orm.StructureData:
+    """Materializes a single structure of a table built by `get_structure_table` as an unstored `StructureData`."""
+    labels = node.get_array('labels')
+    positions = np.flatnonzero(labels == label)
+    if positions.size == 0:
+        raise KeyError(f'no structure with label `{label}`')
+    i = positions[0]
+    start, stop = node.get_array('offsets')[i:i + 2]
+    return get_structure_node(
+        node.get_array('lattices')[i],
+        node.get_array('species')[start:stop].tolist(),
+        node.get_array('frac_coords')[start:stop],
+    )
+
+
+#EOF
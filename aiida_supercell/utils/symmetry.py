@@ -0,0 +1,175 @@
+"""Symmetry analysis of structures generated by Supercell"""
+
+import functools
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from aiida_supercell.utils.cache import DiskCache, LRUCache
+from aiida_supercell.utils.cif import read_supercell_cif
+from aiida_supercell.utils.fingerprint import get_fingerprint
+
+SYMMETRY_TIERS = ('none', 'spacegroup-only', 'full')
+_CRYSTAL_SYSTEMS = (
+    (3, 'triclinic'),
+    (16, 'monoclinic'),
+    (75, 'orthorhombic'),
+    (143, 'tetragonal'),
+    (168, 'trigonal'),
+    (195, 'hexagonal'),
+    (231, 'cubic'),
+)
+
+# Symmetry information keyed by `get_cache_key`, shared by all calculations parsed in the same process
+_SYMMETRY_CACHE = LRUCache(maxsize=4096)
+_DISK_CACHES = {}
+
+
+def get_cache_key(lattice, species: list, frac_coords, tier: str, symprec: float) -> str:
+    """Returns the key of the symmetry information of a structure, from its fingerprint and the analysis settings."""
+    return f'{tier}:{symprec!r}:{get_fingerprint(lattice, species, frac_coords)}'
+
+
+def _get_disk_cache(filename: str) -> DiskCache:
+    """Returns the on-disk cache of a file, opened once per process."""
+    if filename not in _DISK_CACHES:
+        _DISK_CACHES[filename] = DiskCache(filename)
+    return _DISK_CACHES[filename]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_element(symbol: str) -> tuple:
+    """Returns the electronegativity and atomic number of an element."""
+    from pymatgen.core.periodic_table import Element  # pylint: disable=import-outside-toplevel
+    element = Element(symbol)
+    return element.X, element.Z
+
+
+def get_crystal_system(number: int) -> str:
+    """Returns the crystal system of a space group number."""
+    return next(system for bound, system in _CRYSTAL_SYSTEMS if number < bound)
+
+
+def get_symmetry_info(lattice, species: list, frac_coords, tier: str = 'full', symprec: float = 0.01) -> dict:
+    """Analyzes the symmetry of a structure with a single call to spglib
+
+    The results are the same as those of pymatgen's `SpacegroupAnalyzer`, which wraps the same
+    spglib dataset, with the same default tolerances.
+
+    Args:
+        lattice: Lattice vectors as 3x3 array.
+        species (list): Element symbol of each site.
+        frac_coords: Fractional coordinates as Nx3 array.
+        tier (str): `none` skips the analysis, `spacegroup-only` only gives the space group symbol
+            and `full` also gives the crystal system and lattice type.
+        symprec (float): Distance tolerance in Angstroms.
+    Returns:
+        dict: Symmetry information, empty if the tier is `none` or spglib could not find the symmetry.
+    """
+    if tier == 'none':
+        return {}
+
+    import spglib  # pylint: disable=import-outside-toplevel
+    numbers = [_get_element(symbol)[1] for symbol in species]
+    dataset = spglib.get_symmetry_dataset((lattice, frac_coords, numbers), symprec=symprec, angle_tolerance=5)
+    if dataset is None:
+        return {}
+
+    # Older spglib versions return a dictionary, newer ones a dataclass
+    symbol = dataset['international'] if isinstance(dataset, dict) else dataset.international
+    number = dataset['number'] if isinstance(dataset, dict) else dataset.number
+    if tier == 'spacegroup-only':
+        return {'space_group_symbol': symbol}
+
+    crystal_system = get_crystal_system(number)
+    if symbol.startswith('R'):
+        lattice_type = 'rhombohedral'
+    else:
+        lattice_type = 'hexagonal' if crystal_system == 'trigonal' else crystal_system
+    return {
+        'crystal_system': crystal_system,
+        'lattice_type': lattice_type,
+        'space_group_symbol': symbol,
+    }
+
+
+def _read_structure(cif_content: str) -> tuple:
+    """Reads a Supercell output CIF, with its sites sorted as pymatgen's `Structure.sort` does."""
+    lattice, species, frac_coords = read_supercell_cif(cif_content)
+    order = sorted(range(len(species)), key=lambda i: (_get_element(species[i])[0], species[i]))
+    return lattice, [species[i] for i in order], frac_coords[order]
+
+
+def _get_cached(key: str, cache_file: str = None):
+    """Returns the cached symmetry information of a key, from memory then from `cache_file`, or None."""
+    symmetry_info = _SYMMETRY_CACHE.get(key)
+    if symmetry_info is None and cache_file is not None:
+        symmetry_info = _get_disk_cache(cache_file).get(key)
+        if symmetry_info is not None:
+            _SYMMETRY_CACHE.put(key, symmetry_info)
+    return symmetry_info
+
+
+def analyze_structures(  # pylint: disable=too-many-arguments,too-many-locals
+    cif_contents: list,
+    workers: int = 1,
+    tier: str = 'full',
+    symprec: float = 0.01,
+    cache_file: str = None,
+) -> list:
+    """Analyzes a list of Supercell output CIFs, optionally on a pool of processes.
+
+    The CIFs are read in this process and the caches are looked up here, so that only the structures
+    whose symmetry is not known yet, each of them once, are analyzed, on a pool if `workers` is larger
+    than 1. The pool uses the `spawn` start method since forking a daemon worker with open database and
+    broker connections is not safe. The results are returned in the same order as `cif_contents`,
+    regardless of the number of workers.
+
+    Args:
+        cif_contents (list): List of CIF contents as strings.
+        workers (int): Maximum number of processes to use. Defaults to 1 (serial).
+        tier (str): Symmetry tier, see `get_symmetry_info`.
+        symprec (float): Distance tolerance in Angstroms.
+        cache_file (str): SQLite file of symmetry information persisted across processes. The new results
+            are written to it at once, by this process, after the analysis.
+    Returns:
+        list: Tuple of each CIF with the lattice, species and fractional coordinates of its structure, sorted
+        by `_read_structure`, and the dictionary of its symmetry information. Plain arrays are cheaper than
+        pymatgen objects to send back from a pool and to turn into `StructureData`.
+    """
+    structures = [_read_structure(cif_content) for cif_content in cif_contents]
+    if tier == 'none':
+        return [(structure, {}) for structure in structures]
+
+    keys = [get_cache_key(*structure, tier, symprec) for structure in structures]
+    known = {}
+    missing = {}
+    for key, structure in zip(keys, structures):
+        if key in known or key in missing:
+            continue
+        symmetry_info = _get_cached(key, cache_file)
+        if symmetry_info is None:
+            missing[key] = structure
+        else:
+            known[key] = symmetry_info
+
+    workers = min(workers, len(missing), os.cpu_count() or 1)
+    lattices, species, frac_coords = zip(*missing.values()) if missing else ((), (), ())
+    analyze = functools.partial(get_symmetry_info, tier=tier, symprec=symprec)
+    if workers <= 1:
+        computed = list(map(analyze, lattices, species, frac_coords))
+    else:
+        chunksize = max(1, len(missing) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            computed = list(executor.map(analyze, lattices, species, frac_coords, chunksize=chunksize))
+
+    computed = dict(zip(missing, computed))
+    for key, symmetry_info in computed.items():
+        _SYMMETRY_CACHE.put(key, symmetry_info)
+    computed = {key: symmetry_info for key, symmetry_info in computed.items() if symmetry_info}
+    if cache_file is not None and computed:
+        _get_disk_cache(cache_file).put_many(computed)
+    known.update(computed)
+    return [(structure, dict(known.get(key, {}))) for key, structure in zip(keys, structures)]
+
+#EOF
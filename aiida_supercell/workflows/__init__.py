@@ -0,0 +1,8 @@
+"""AiiDA-Supercell plugin -- WorkChains"""
+
+from .sharded import SupercellShardedWorkChain
+from .sweep import SupercellSweepWorkChain
+
+__all__ = ('SupercellShardedWorkChain', 'SupercellSweepWorkChain')
+
+#EOF
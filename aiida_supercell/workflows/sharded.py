@@ -0,0 +1,229 @@
+"""AiiDA-Supercell plugin -- Sharded enumeration WorkChain"""
+
+import hashlib
+
+from aiida import orm
+from aiida.common import AttributeDict
+from aiida.common.links import LinkType
+from aiida.engine import WorkChain, append_, calcfunction
+
+from aiida_supercell.calculations import SupercellCalculation
+from aiida_supercell.utils.fingerprint import get_structure_fingerprint
+from aiida_supercell.utils.structures import get_structure_info, get_structures_info
+
+RANDOM_SAMPLING = 'random'
+
+
+def derive_random_seed(random_seed: int, shard: int) -> int:
+    """Derives a reproducible, well separated random seed for a shard from the base seed."""
+    digest = hashlib.sha256(f'{random_seed}:{shard}'.encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) % (2**31 - 1) + 1
+
+
+def distribute_samples(sample_structures: dict, num_shards: int) -> list:
+    """Distributes a sampling request over a number of shards
+
+    The `random` quota is split as evenly as possible, since shards with different seeds draw
+    different samples. The deterministic modes (`low_energy`, `high_energy`, `first`, `last`
+    and `degeneracy`) would give the same structures in every shard, therefore each of them is
+    assigned to a single shard, in turn, so that different modes run concurrently. A single
+    deterministic mode, e.g. a large `low_energy` request, is not sped up by sharding: Supercell
+    has to enumerate the whole configuration space to find the extremes of the energy.
+
+    Args:
+        sample_structures (dict): Sampling request as given to `SupercellCalculation`.
+        num_shards (int): Number of shards.
+    Returns:
+        list: Sampling request of each shard. Shards with nothing to sample are left out.
+    """
+    shards = [{} for _ in range(num_shards)]
+    if RANDOM_SAMPLING in sample_structures:
+        quota, remainder = divmod(sample_structures[RANDOM_SAMPLING], num_shards)
+        for i, shard in enumerate(shards):
+            if quota + (i < remainder) > 0:
+                shard[RANDOM_SAMPLING] = quota + (i < remainder)
+
+    deterministic = sorted(key for key in sample_structures if key != RANDOM_SAMPLING)
+    for i, key in enumerate(deterministic):
+        # Start from the shard with the smallest random quota
+        shards[num_shards - 1 - i % num_shards][key] = sample_structures[key]
+
+    return [shard for shard in shards if shard]
+
+
+def validate_sample_structures(value, _):
+    """Validate that the sampling request asks for at least one structure."""
+    if not any(size > 0 for size in value.get_dict().values()):
+        return '`sample_structures` must request at least one structure.'
+    return None
+
+
+def validate_num_shards(value, _):
+    """Validate that there is at least one shard."""
+    if value.value < 1:
+        return '`num_shards` must be at least 1.'
+    return None
+
+
+def get_output_structures(calculation: orm.CalcJobNode) -> dict:
+    """Returns the `output_structures` of a `SupercellCalculation` keyed by label."""
+    prefix = 'output_structures__'
+    outgoing = calculation.get_outgoing(link_type=LinkType.CREATE, link_label_filter=f'{prefix}%')
+    return {triple.link_label[len(prefix):]: triple.node for triple in outgoing.all()}
+
+
+@calcfunction
+def merge_shard_outputs(**kwargs):
+    """Merges the outputs of the shards of a `SupercellShardedWorkChain`
+
+    Expects `parameters_<i>` `Dict` nodes, `structure_<i>_<label>` `StructureData` nodes and, when
+    available, `info_<i>` `ArrayData` nodes with the `output_structures_info` of the shards.
+    Identical structures found in several shards are kept once. A label used in several shards
+    for different structures is suffixed with the index of the shard.
+
+    Returns:
+        dict: Merged `output_parameters`, whose `Label_map` maps each merged label to its shard and
+        label, and merged `output_structures_info` if the shards have any.
+    """
+    num_shards = len([key for key in kwargs if key.startswith('parameters_')])
+    merged = kwargs['parameters_0'].get_dict()
+    merged.pop('Random_seed', None)
+    merged['Random_seeds'] = []
+    merged['Label_map'] = {}
+    merged['Number_of_duplicates'] = 0
+
+    infos = []
+    fingerprints = set()
+    for shard in range(num_shards):
+        parameters = kwargs[f'parameters_{shard}'].get_dict()
+        merged['Random_seeds'].append(parameters.get('Random_seed'))
+        prefix = f'structure_{shard}_'
+        for key in sorted(key for key in kwargs if key.startswith(prefix)):
+            label = key[len(prefix):]
+            fingerprint = get_structure_fingerprint(kwargs[key])
+            if fingerprint in fingerprints:
+                merged['Number_of_duplicates'] += 1
+                continue
+            fingerprints.add(fingerprint)
+            merged_label = label if label not in merged['Label_map'] else f'{label}_{shard}'
+            merged['Label_map'][merged_label] = [shard, label]
+            if f'info_{shard}' in kwargs:
+                infos.append(get_structure_info(kwargs[f'info_{shard}'], label))
+
+    results = {'output_parameters': orm.Dict(dict=merged)}
+    if infos and len(infos) == len(merged['Label_map']):
+        energies = [info['coulombic_energy'] for info in infos] if 'coulombic_energy' in infos[0] else None
+        results['output_structures_info'] = get_structures_info(
+            list(merged['Label_map']), [info['degeneracy'] for info in infos], infos, energies
+        )
+    return results
+
+
+class SupercellShardedWorkChain(WorkChain):
+    """WorkChain that splits a large sampling request over concurrent `SupercellCalculation`s
+
+    Each shard gets its own random seed, derived from `random_seed`, and its own part of
+    `sample_structures`. The outputs of the shards are merged into a single set of
+    parameters and structures, without duplicates.
+    """
+
+    @classmethod
+    def define(cls, spec):
+        super().define(spec)
+
+        spec.expose_inputs(
+            SupercellCalculation,
+            namespace='supercell',
+            exclude=('random_seed', 'sample_structures', 'compact_structures')
+        )
+        spec.input(
+            'sample_structures',
+            valid_type=orm.Dict,
+            required=True,
+            validator=validate_sample_structures,
+            help='How to sample structures from huge configuration space'
+        )
+        spec.input(
+            'num_shards',
+            valid_type=orm.Int,
+            default=lambda: orm.Int(2),
+            validator=validate_num_shards,
+            help='Number of shards'
+        )
+        spec.input(
+            'random_seed',
+            valid_type=orm.Int,
+            required=False,
+            help='Random seed from which the random seed of each shard is derived'
+        )
+
+        spec.outline(
+            cls.run_shards,
+            cls.inspect_shards,
+            cls.results,
+        )
+
+        spec.output('output_parameters', valid_type=orm.Dict, required=True, help='merged results of the shards')
+        spec.output(
+            'output_structures_info',
+            valid_type=orm.ArrayData,
+            required=False,
+            help='merged per-structure information of the shards'
+        )
+        spec.output_namespace(
+            'output_structures', valid_type=orm.StructureData, required=True, dynamic=True, help='merged structures'
+        )
+
+        spec.exit_code(300, 'ERROR_SHARD_FAILED', message='At least one of the shards failed.')
+        spec.exit_code(301, 'ERROR_NO_SHARDS', message='The sampling request does not give any shard to run.')
+
+    def run_shards(self):
+        """Submit a `SupercellCalculation` for each shard."""
+        if 'random_seed' in self.inputs:
+            random_seed = self.inputs.random_seed.value
+        else:
+            random_seed = int(self.uuid.replace('-', '')[:8], 16)
+
+        samples = distribute_samples(self.inputs.sample_structures.get_dict(), self.inputs.num_shards.value)
+        if not samples:
+            self.report('the sampling request does not give any shard to run')
+            return self.exit_codes.ERROR_NO_SHARDS  # pylint: disable=no-member
+
+        for shard, sample_structures in enumerate(samples):
+            inputs = AttributeDict(self.exposed_inputs(SupercellCalculation, 'supercell'))
+            inputs.sample_structures = orm.Dict(dict=sample_structures)
+            inputs.random_seed = orm.Int(derive_random_seed(random_seed, shard))
+            inputs.metadata = dict(inputs.get('metadata', {}), call_link_label=f'shard_{shard}')
+
+            running = self.submit(SupercellCalculation, **inputs)
+            self.report(f'submitted shard {shard} <{running.pk}> sampling {sample_structures}')
+            self.to_context(shards=append_(running))
+        return None
+
+    def inspect_shards(self):
+        """Check that all shards finished successfully."""
+        failed = [shard.pk for shard in self.ctx.shards if not shard.is_finished_ok]
+        if failed:
+            self.report(f'shards {failed} did not finish successfully')
+            return self.exit_codes.ERROR_SHARD_FAILED  # pylint: disable=no-member
+        return None
+
+    def results(self):
+        """Merge the outputs of the shards."""
+        merge_inputs = {}
+        for i, shard in enumerate(self.ctx.shards):
+            merge_inputs[f'parameters_{i}'] = shard.outputs.output_parameters
+            if 'output_structures_info' in shard.outputs:
+                merge_inputs[f'info_{i}'] = shard.outputs.output_structures_info
+            for label, structure in get_output_structures(shard).items():
+                merge_inputs[f'structure_{i}_{label}'] = structure
+
+        merged = merge_shard_outputs(**merge_inputs)
+        self.out('output_parameters', merged['output_parameters'])
+        if 'output_structures_info' in merged:
+            self.out('output_structures_info', merged['output_structures_info'])
+        for merged_label, (i, label) in merged['output_parameters'].get_dict()['Label_map'].items():
+            self.out(f'output_structures.{merged_label}', merge_inputs[f'structure_{i}_{label}'])
+
+
+#EOF
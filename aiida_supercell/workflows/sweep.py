@@ -0,0 +1,176 @@
+"""AiiDA-Supercell plugin -- Parameter sweep WorkChain"""
+
+import itertools
+
+from aiida import orm
+from aiida.common import AttributeDict
+from aiida.engine import ToContext, WorkChain, calcfunction, while_
+
+from aiida_supercell.calculations import SupercellCalculation
+
+
+def get_combinations(supercell_sizes: list, charges: list = None, sample_structures: list = None) -> list:
+    """Returns every combination of supercell size, charges and sampling request of a sweep
+
+    Args:
+        supercell_sizes (list): List of supercell sizes.
+        charges (list): List of charge dictionaries. Defaults to charges not being set.
+        sample_structures (list): List of sampling requests. Defaults to sampling not being set.
+    Returns:
+        list: List of dictionaries with the `supercell_size`, `charges` and `sample_structures` keys.
+    """
+    return [{
+        'supercell_size': size,
+        'charges': charge,
+        'sample_structures': samples,
+    } for size, charge, samples in itertools.product(supercell_sizes, charges or [None], sample_structures or [None])]
+
+
+def validate_max_concurrent(value, _):
+    """Validate that at least one calculation may run at a time."""
+    if value.value < 1:
+        return '`max_concurrent` must be at least 1.'
+    return None
+
+
+@calcfunction
+def summarize_sweep(combinations, **kwargs):
+    """Builds the summary table of a `SupercellSweepWorkChain`
+
+    Args:
+        combinations (orm.List): Combinations of the sweep, with the exit status of their calculation.
+        kwargs: `parameters_<i>` `Dict` nodes with the `output_parameters` of the i-th combination.
+    Returns:
+        orm.Dict: One row per combination.
+    """
+    rows = []
+    for i, combination in enumerate(combinations.get_list()):
+        row = dict(combination)
+        if f'parameters_{i}' in kwargs:
+            parameters = kwargs[f'parameters_{i}'].get_dict()
+            number_of_structures = parameters.get('Number_of_structures', {})
+            energies = parameters.get('Coulomb_energies', {})
+            row.update({
+                'total_combinations': number_of_structures.get('total_combinations'),
+                'symmetrically_distinct': number_of_structures.get('symmetrically_distinct'),
+                'total_charge': parameters.get('Supecell_total_charge'),
+                'charge_balanced': parameters.get('Supecell_total_charge') == 0,
+                'min_energy': energies.get('min'),
+                'max_energy': energies.get('max'),
+            })
+        rows.append(row)
+    return orm.Dict(dict={'rows': rows})
+
+
+class SupercellSweepWorkChain(WorkChain):
+    """WorkChain that runs a `SupercellCalculation` for each combination of sizes, charges and sampling requests
+
+    At most `max_concurrent` calculations run at the same time: whenever calculations finish, new
+    ones are submitted in their place. Once all of them are finished, a summary table of the sweep
+    is created.
+    """
+
+    @classmethod
+    def define(cls, spec):
+        super().define(spec)
+
+        spec.expose_inputs(
+            SupercellCalculation, namespace='supercell', exclude=('supercell_size', 'charges', 'sample_structures')
+        )
+        spec.input('supercell_sizes', valid_type=orm.List, required=True, help='List of supercell sizes')
+        spec.input('charges', valid_type=orm.List, required=False, help='List of dictionaries of formal charges')
+        spec.input(
+            'sample_structures', valid_type=orm.List, required=False, help='List of dictionaries of sampling requests'
+        )
+        spec.input(
+            'max_concurrent',
+            valid_type=orm.Int,
+            default=lambda: orm.Int(4),
+            validator=validate_max_concurrent,
+            help='Maximum number of calculations running at the same time'
+        )
+
+        spec.outline(
+            cls.setup,
+            while_(cls.should_run)(
+                cls.submit_calculations,
+                cls.collect_calculations,
+            ),
+            cls.results,
+        )
+
+        spec.output('sweep_summary', valid_type=orm.Dict, required=True, help='summary table of the sweep')
+
+        spec.exit_code(300, 'ERROR_ALL_CALCULATIONS_FAILED', message='None of the calculations finished successfully.')
+
+    def setup(self):
+        """Build the list of combinations to run."""
+        self.ctx.combinations = get_combinations(
+            self.inputs.supercell_sizes.get_list(),
+            self.inputs.charges.get_list() if 'charges' in self.inputs else None,
+            self.inputs.sample_structures.get_list() if 'sample_structures' in self.inputs else None,
+        )
+        self.ctx.next_combination = 0
+        self.ctx.calculations = [None] * len(self.ctx.combinations)
+        self.ctx.running = []
+
+    def should_run(self):
+        """Return whether combinations remain to be submitted or calculations are still running."""
+        return self.ctx.next_combination < len(self.ctx.combinations) or len(self.ctx.running) > 0
+
+    def submit_calculations(self):
+        """Submit calculations until `max_concurrent` are running, then wait for the oldest of them."""
+        while self.should_submit():
+            i = self.ctx.next_combination
+            combination = self.ctx.combinations[i]
+            inputs = AttributeDict(self.exposed_inputs(SupercellCalculation, 'supercell'))
+            inputs.supercell_size = orm.List(list=combination['supercell_size'])
+            if combination['charges'] is not None:
+                inputs.charges = orm.Dict(dict=combination['charges'])
+            if combination['sample_structures'] is not None:
+                inputs.sample_structures = orm.Dict(dict=combination['sample_structures'])
+            inputs.metadata = dict(inputs.get('metadata', {}), call_link_label=f'combination_{i}')
+
+            running = self.submit(SupercellCalculation, **inputs)
+            self.report(f'submitted combination {i} <{running.pk}>: {combination}')
+            self.ctx.calculations[i] = running.pk
+            self.ctx.running.append(running.pk)
+            self.ctx.next_combination += 1
+
+        # The engine can only wait for given processes, hence the oldest one, which is likely to finish first
+        return ToContext(waiting=orm.load_node(self.ctx.running[0]))
+
+    def should_submit(self):
+        """Return whether combinations remain to be submitted and a slot is free."""
+        return self.ctx.next_combination < len(self.ctx.combinations) and \
+            len(self.ctx.running) < self.inputs.max_concurrent.value
+
+    def collect_calculations(self):
+        """Free the slots of all calculations that finished, reporting those that failed."""
+        running = []
+        for pk in self.ctx.running:
+            calculation = orm.load_node(pk)
+            if not calculation.is_terminated:
+                running.append(pk)
+            elif not calculation.is_finished_ok:
+                self.report(f'calculation <{calculation.pk}> failed with exit status {calculation.exit_status}')
+        self.ctx.running = running
+
+    def results(self):
+        """Create the summary table of the sweep."""
+        combinations = []
+        parameters = {}
+        for i, (combination, pk) in enumerate(zip(self.ctx.combinations, self.ctx.calculations)):
+            calculation = orm.load_node(pk)
+            combinations.append(dict(combination, pk=calculation.pk, exit_status=calculation.exit_status))
+            if calculation.is_finished_ok:
+                parameters[f'parameters_{i}'] = calculation.outputs.output_parameters
+
+        if not parameters:
+            return self.exit_codes.ERROR_ALL_CALCULATIONS_FAILED  # pylint: disable=no-member
+
+        self.out('sweep_summary', summarize_sweep(orm.List(list=combinations), **parameters))
+        return None
+
+
+#EOF
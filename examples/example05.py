@@ -0,0 +1,70 @@
+"""Example using SupercellShardedWorkChain"""
+import os
+import sys
+import click
+
+from aiida.common import NotExistent
+from aiida.plugins import DataFactory
+from aiida.engine import run_get_pk
+from aiida.plugins import WorkflowFactory
+from aiida.orm import Code, Dict, Bool, Str, List, Int
+
+SinglefileData = DataFactory('singlefile')
+
+
+def example_05(code: Code):
+    """Prepare the builder to submit.
+
+    Args:
+        code (Code): Supercell code object.
+    """
+
+    pwd = os.path.dirname(os.path.realpath(__file__))
+    structure = SinglefileData(file=os.path.join(pwd, 'test.cif'))
+
+    SupercellShardedWorkChain = WorkflowFactory('supercell.sharded')
+
+    builder = SupercellShardedWorkChain.get_builder()
+
+    builder.supercell.code = code
+    builder.supercell.structure = structure
+    builder.supercell.charges = Dict(dict={'Ca*': 2, 'Al*': 3, 'Si*': 4, 'O*': -2})
+    builder.supercell.calculate_coulomb_energies = Bool(True)
+    builder.supercell.charge_balance_method = Str('yes')
+    builder.supercell.merge_symmetric = Bool('True')
+    builder.supercell.supercell_size = List(list=[1, 1, 2])
+    builder.supercell.metadata.options.resources = {  #pylint: disable = no-member
+        'num_machines': 1,
+        'num_mpiprocs_per_machine': 1,
+    }
+    builder.supercell.save_as_archive = Bool(False)
+    builder.supercell.metadata.options.max_wallclock_seconds = 1 * 30 * 60
+
+    builder.num_shards = Int(3)
+    builder.random_seed = Int(1000)
+    builder.sample_structures = Dict(dict={
+        'low_energy': 2,
+        'high_energy': 2,
+        'random': 6,
+    })
+
+    _, pk = run_get_pk(builder)
+    print('workchain pk: ', pk)
+
+
+@click.command('cli')
+@click.argument('codelabel')
+def cli(codelabel):
+    """Click interface"""
+    try:
+        code = Code.get_from_string(codelabel)
+    except NotExistent:
+        print("The code '{}' does not exist".format(codelabel))
+        sys.exit(1)
+    example_05(code)
+
+
+if __name__ == '__main__':
+    cli()  # pylint: disable=no-value-for-parameter
+
+# EOF
@@ -0,0 +1,65 @@
+"""Example using SupercellSweepWorkChain"""
+import os
+import sys
+import click
+
+from aiida.common import NotExistent
+from aiida.plugins import DataFactory
+from aiida.engine import run_get_pk
+from aiida.plugins import WorkflowFactory
+from aiida.orm import Code, Bool, Str, List, Int
+
+SinglefileData = DataFactory('singlefile')
+
+
+def example_06(code: Code):
+    """Prepare the builder to submit.
+
+    Args:
+        code (Code): Supercell code object.
+    """
+
+    pwd = os.path.dirname(os.path.realpath(__file__))
+    structure = SinglefileData(file=os.path.join(pwd, 'test.cif'))
+
+    SupercellSweepWorkChain = WorkflowFactory('supercell.sweep')
+
+    builder = SupercellSweepWorkChain.get_builder()
+
+    builder.supercell.code = code
+    builder.supercell.structure = structure
+    builder.supercell.calculate_coulomb_energies = Bool(True)
+    builder.supercell.charge_balance_method = Str('yes')
+    builder.supercell.merge_symmetric = Bool('True')
+    builder.supercell.metadata.options.resources = {  #pylint: disable = no-member
+        'num_machines': 1,
+        'num_mpiprocs_per_machine': 1,
+    }
+    builder.supercell.save_as_archive = Bool(False)
+    builder.supercell.metadata.options.max_wallclock_seconds = 1 * 30 * 60
+
+    builder.supercell_sizes = List(list=[[1, 1, 2], [2, 1, 1]])
+    builder.charges = List(list=[{'Ca*': 2, 'Al*': 3, 'Si*': 4, 'O*': -2}])
+    builder.sample_structures = List(list=[{'low_energy': 2}, {'high_energy': 2}])
+    builder.max_concurrent = Int(2)
+
+    _, pk = run_get_pk(builder)
+    print('workchain pk: ', pk)
+
+
+@click.command('cli')
+@click.argument('codelabel')
+def cli(codelabel):
+    """Click interface"""
+    try:
+        code = Code.get_from_string(codelabel)
+    except NotExistent:
+        print("The code '{}' does not exist".format(codelabel))
+        sys.exit(1)
+    example_06(code)
+
+
+if __name__ == '__main__':
+    cli()  # pylint: disable=no-value-for-parameter
+
+# EOF
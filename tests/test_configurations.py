@@ -0,0 +1,70 @@
+"""Tests of the estimation of the configuration space before submission"""
+import math
+import os
+
+from aiida_supercell.utils.configurations import estimate_configurations, get_total_charge
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+TEST_CIF = os.path.join(THIS_DIR, os.pardir, 'examples', 'test.cif')
+
+# Two symmetry-inequivalent Al0.5/Si0.5 sites of a P1 cell
+TWO_SITES_CIF = """data_two_sites
+_symmetry_space_group_name_H-M   'P 1'
+_cell_length_a   4.0
+_cell_length_b   4.0
+_cell_length_c   4.0
+_cell_angle_alpha   90
+_cell_angle_beta   90
+_cell_angle_gamma   90
+loop_
+ _symmetry_equiv_pos_as_xyz
+  'x, y, z'
+loop_
+ _atom_site_label
+ _atom_site_type_symbol
+ _atom_site_fract_x
+ _atom_site_fract_y
+ _atom_site_fract_z
+ _atom_site_occupancy
+  Al1  Al  0.0  0.0  0.0  0.5
+  Si1  Si  0.0  0.0  0.0  0.5
+  Al2  Al  0.5  0.5  0.5  0.5
+  Si2  Si  0.5  0.5  0.5  0.5
+"""
+
+
+def test_inequivalent_sites_are_counted_apart():
+    """Sites with the same occupancies but different orbits give one multinomial each."""
+    estimate = estimate_configurations(TWO_SITES_CIF, [2, 2, 2])
+    assert estimate['total_combinations'] == math.comb(8, 4)**2
+    assert [group['labels'] for group in estimate['groups']] == [['Al1', 'Si1'], ['Al2', 'Si2']]
+
+
+def test_orbits_from_symmetry_operations():
+    """The orbit of the mixed site of `test.cif` has four positions in the unit cell, as reported by Supercell."""
+    with open(TEST_CIF) as handle:
+        estimate = estimate_configurations(handle.read(), [1, 1, 2])
+    assert estimate['total_combinations'] == math.comb(8, 4)
+    assert estimate['groups'] == [{
+        'labels': ['AlT2', 'SiT2'],
+        'occupancies': {
+            'AlT2': 0.5,
+            'SiT2': 0.5,
+        },
+        'positions': 8,
+        'combinations': 70,
+    }]
+
+
+def test_total_charge():
+    """Charges are resolved per row, whatever their order, and missing oxidation numbers give an unknown charge."""
+    with open(TEST_CIF) as handle:
+        cif_content = handle.read()
+    assert get_total_charge(cif_content) == 0.0
+    assert get_total_charge(cif_content, {'Ca*': 2, 'Si*': 4, 'Al*': 3, 'O*': -2}) == 0.0
+    assert get_total_charge(cif_content, {'O*': -2, 'Al*': 3, 'Si*': 4, 'Ca*': 2}) == 0.0
+    assert get_total_charge(cif_content, {'Ca*': 2, 'Al*': 3, 'AlT1': 2, 'Si*': 4, 'O*': -2}) == -2.0
+    assert get_total_charge(TWO_SITES_CIF) is None
+
+
+#EOF
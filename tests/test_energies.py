@@ -0,0 +1,38 @@
+"""Tests of the reading of the Coulomb energy files written by Supercell"""
+import numpy as np
+
+from aiida_supercell.utils.archive import parse_structure_name
+from aiida_supercell.utils.energies import iterate_energy_chunks, load_energies, select_energies
+
+LINES = [f'aiida_supercell_i{i:03d}_w{i % 5 + 1}.cif   {(7 * i) % 13 - 20:.6f}\n' for i in range(40)]
+
+
+def test_chunks_match_names():
+    """Labels and degeneracies are split out of the names as by `parse_structure_name`, whatever the chunk size."""
+    lines = LINES[:10] + ['\n', 'Output/aiida_supercell_i900_w12.cif -1.5e+01\n'] + LINES[10:]
+    for chunk_size in (1, 7, 1000):
+        labels, energies, degeneracies = load_energies(iterate_energy_chunks(lines, chunk_size))
+        names = [line.split() for line in lines if line.strip()]
+        assert labels.dtype == np.dtype('S4')
+        assert degeneracies.dtype == np.int32
+        parsed = [(label.decode(), degeneracy) for label, degeneracy in zip(labels.tolist(), degeneracies.tolist())]
+        assert parsed == [parse_structure_name(name) for name, _ in names]
+        assert energies.tolist() == [float(energy) for _, energy in names]
+
+
+def test_select_energies():
+    """The selection over chunks is that of a sort over all records, ties going to the last label."""
+    labels, energies, degeneracies = load_energies(iterate_energy_chunks(LINES))
+    for mode, sign in (('low_energy', 1), ('high_energy', -1)):
+        by_label = sorted(range(len(LINES)), key=lambda i: labels[i], reverse=True)
+        order = sorted(by_label, key=lambda i, sign=sign: sign * energies[i])[:6]
+        selected, selected_energies, selected_degeneracies, summary = select_energies(
+            iterate_energy_chunks(LINES, 9), 6, mode
+        )
+        assert selected.tolist() == labels[order].tolist()
+        assert selected_energies.tolist() == energies[order].tolist()
+        assert selected_degeneracies.tolist() == degeneracies[order].tolist()
+        assert summary['number_of_structures'] == len(LINES)
+
+
+#EOF
@@ -0,0 +1,103 @@
+"""Tests of the merging of equivalent configurations given as occupation vectors"""
+import itertools
+
+import numpy as np
+from pymatgen.core import Lattice, Structure
+
+from aiida_supercell.utils.merging import (
+    canonicalize, get_site_permutations, merge_configurations, merge_occupation_tables
+)
+from aiida_supercell.utils.occupations import build_template, decode_configurations, get_occupation_table
+
+FCC_POSITIONS = [[0, 0, 0], [0.5, 0.5, 0], [0.5, 0, 0.5], [0, 0.5, 0.5]]
+
+
+def get_parent():
+    """Returns a disordered fcc structure with an interstitial site half occupied by oxygen."""
+    return Structure(
+        Lattice.cubic(4.0),
+        [{'Cu': 0.5, 'Au': 0.5}] * 4 + [{'O': 0.5}] * 2,
+        FCC_POSITIONS + [[0.5, 0.5, 0.5], [0.5, 0, 0]],
+    )
+
+
+def get_configurations(template, site_types):
+    """Returns the occupation vectors of all configurations of the template, with two Cu and two Au per cell."""
+    _, _, alphabet = template
+    metal = np.flatnonzero(site_types == site_types[0])
+    other = np.flatnonzero(site_types != site_types[0])
+    configurations = []
+    for copper in itertools.combinations(metal, len(metal) // 2):
+        for oxygen in itertools.combinations(other, len(other) // 2):
+            occupations = np.zeros(len(site_types), dtype=np.uint8)
+            occupations[metal] = alphabet.index('Au')
+            occupations[list(copper)] = alphabet.index('Cu')
+            occupations[list(oxygen)] = alphabet.index('O')
+            configurations.append(occupations)
+    return np.array(configurations)
+
+
+def test_template_covers_vacant_positions():
+    """The template holds every site of the parent structure, and their types come from the parent sites."""
+    template, site_types = build_template(get_parent(), [1, 1, 2])
+    assert len(template[1]) == 12
+    assert template[2] == ['', 'Au', 'Cu', 'O']
+    assert sorted(np.bincount(site_types).tolist()) == [4, 8]
+
+
+def test_orbits_sum_degeneracies():
+    """All configurations of the enumeration merge into orbits whose degeneracies add up to their number."""
+    template, site_types = build_template(get_parent(), [1, 1, 1])
+    occupations = get_configurations(template, site_types)
+    permutations = np.unique(get_site_permutations(template, site_types), axis=0)
+    merged = merge_configurations(occupations, np.ones(len(occupations), dtype=np.int64), permutations)
+
+    orbits = {min(tuple(occupation[permutation]) for permutation in permutations) for occupation in occupations}
+    assert len(merged['representatives']) == len(orbits) == 4
+    assert merged['degeneracies'].sum() == len(occupations)
+
+
+def test_constant_positions_are_mapped():
+    """Positions with the same species, or vacant, in every sample are still mapped by the operations of the parent.
+
+    Inferring the types of the positions from these two samples would give the oxygen on the fifth position and
+    the vacancy on the seventh position types of their own, and the configurations would not be merged.
+    """
+    template, site_types = build_template(get_parent(), [1, 1, 2])
+    samples = np.array([
+        [2, 2, 2, 1, 3, 2, 0, 1, 1, 3, 1, 0],
+        [2, 1, 2, 2, 3, 1, 0, 1, 2, 0, 1, 3],
+    ], dtype=np.uint8)
+    permutations = np.unique(get_site_permutations(template, site_types), axis=0)
+    canonical = canonicalize(samples, permutations)
+    assert (canonical[0] == canonical[1]).all()
+
+
+def test_batches_do_not_change_results():
+    """The memory budget only changes the size of the batches."""
+    template, site_types = build_template(get_parent(), [1, 1, 2])
+    occupations = get_configurations(template, site_types)[:200]
+    permutations = np.unique(get_site_permutations(template, site_types), axis=0)
+    assert (canonicalize(occupations, permutations) == canonicalize(occupations, permutations, max_memory=1)).all()
+
+
+def test_merge_tables_of_several_runs():
+    """Configurations found by several runs are kept once, with the largest of their degeneracies."""
+    template, site_types = build_template(get_parent(), [1, 1, 1])
+    occupations = get_configurations(template, site_types)
+    permutations = get_site_permutations(template, site_types)
+    tables = []
+    for rows in (slice(0, 8), slice(4, 12)):
+        labels = [f'i{i}' for i in range(len(occupations[rows]))]
+        structures = decode_configurations(template, occupations[rows])
+        tables.append(get_occupation_table(labels, structures, template, site_types))
+    degeneracies = [np.ones(8, dtype=np.int64), np.ones(8, dtype=np.int64)]
+
+    merged = merge_occupation_tables(tables, degeneracies, len(permutations))
+    single = merge_configurations(occupations, np.ones(len(occupations)), np.unique(permutations, axis=0))
+    assert sorted(map(bytes, merged['occupations'])) == sorted(map(bytes, single['occupations']))
+    assert merged['degeneracies'].sum() <= single['degeneracies'].sum()
+    assert merged['sources'].tolist() == sorted(merged['sources'].tolist())
+
+
+#EOF
@@ -0,0 +1,38 @@
+"""Tests of the parsing of the Supercell `output.log`"""
+import json
+import os
+
+import pytest
+
+from aiida_supercell.utils import parse_supercell_output
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+FIXTURES_DIR = os.path.join(THIS_DIR, 'fixtures')
+
+# Each log comes with the output of the original line-by-line parser, dumped to JSON in the order of its keys
+OUTPUT_LOGS = ['output', 'output_verbose', 'output_charged']
+
+
+def get_expected(name):
+    """Returns the dictionary of the original parser for the log `name`, serialized"""
+    with open(os.path.join(FIXTURES_DIR, f'{name}.json')) as handle:
+        return json.dumps(json.load(handle))
+
+
+@pytest.mark.parametrize('name', OUTPUT_LOGS)
+def test_parse_output_string(name):
+    """The content of the log gives the same dictionary as the original parser, in the same order."""
+    with open(os.path.join(FIXTURES_DIR, f'{name}.log')) as handle:
+        result = parse_supercell_output(handle.read())
+    assert json.dumps(result) == get_expected(name)
+
+
+@pytest.mark.parametrize('name', OUTPUT_LOGS)
+def test_parse_output_handle(name):
+    """Consuming the log line by line from a file handle gives the same dictionary."""
+    with open(os.path.join(FIXTURES_DIR, f'{name}.log')) as handle:
+        result = parse_supercell_output(handle)
+    assert json.dumps(result) == get_expected(name)
+
+
+#EOF
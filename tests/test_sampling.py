@@ -0,0 +1,56 @@
+"""Tests of the sampling of structures from a stream of records"""
+import pytest
+
+from aiida_supercell.utils.sampling import sample_records
+
+RECORDS = [(f'i{i:02d}', float((7 * i) % 11), i % 4 + 1) for i in range(20)]
+
+
+def get_labels(sampled):
+    """Returns the sampled labels of each mode."""
+    return {mode: [label for label, _, _ in records] for mode, records in sampled.items()}
+
+
+def test_deterministic_modes():
+    """The energy, `first`, `last` and `degeneracy` modes only depend on the records."""
+    sampled = get_labels(
+        sample_records(iter(RECORDS), {
+            'low_energy': 2,
+            'high_energy': 2,
+            'first': 3,
+            'last': 2,
+            'degeneracy': 1,
+        })
+    )
+    assert sampled == {
+        'low_energy': ['i00', 'i11'],
+        'high_energy': ['i03', 'i14'],
+        'first': ['i00', 'i01', 'i02'],
+        'last': ['i18', 'i19'],
+        'degeneracy': ['i00', 'i04', 'i08', 'i12', 'i16'],
+    }
+
+
+def test_degeneracy_threshold():
+    """The `degeneracy` mode keeps every structure whose degeneracy is at most the given value."""
+    sampled = sample_records(iter(RECORDS), {'degeneracy': 2})['degeneracy']
+    assert sampled == [record for record in RECORDS if record[2] <= 2]
+
+
+def test_random_seed():
+    """The `random` mode is reproducible for a given seed."""
+    first = get_labels(sample_records(iter(RECORDS), {'random': 5}, random_seed=7))
+    second = get_labels(sample_records(iter(RECORDS), {'random': 5}, random_seed=7))
+    assert first == second
+    assert len(set(first['random'])) == 5
+
+
+def test_errors():
+    """Unknown modes and energy modes without energies are rejected."""
+    with pytest.raises(ValueError):
+        sample_records(iter(RECORDS), {'lowest': 2})
+    with pytest.raises(ValueError):
+        sample_records(iter([('i00', None, 1)]), {'low_energy': 1})
+
+
+#EOF